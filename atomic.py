@@ -0,0 +1,44 @@
+import os
+import uuid
+from collections.abc import Iterable
+from contextlib import contextmanager
+from pathlib import Path
+
+import aiofiles
+
+
+@contextmanager
+def atomic_path(path: Path):
+    """
+    A temporary path next to `path` to create the file at, which is moved over `path` once the block completes. An
+    interrupted run thus never leaves a truncated file behind for later runs to take for a complete one, and a file
+    already at `path` (possibly a hard link into the cache) is replaced rather than written to. Each caller gets its
+    own temporary path, as several may be writing the same file at once.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+    try:
+        yield partial
+        os.replace(partial, path)
+    finally:
+        partial.unlink(missing_ok=True)
+
+
+def atomic_write(path: Path, content: bytes | str | Iterable[bytes]):
+    """Write `content`, or each of its chunks in turn, to `path` through `atomic_path`."""
+    with atomic_path(path) as partial:
+        if isinstance(content, str):
+            partial.write_text(content, encoding="utf-8")
+        elif isinstance(content, bytes):
+            partial.write_bytes(content)
+        else:
+            with open(partial, "wb") as f:
+                for chunk in content:
+                    f.write(chunk)
+
+
+async def atomic_write_async(path: Path, content: bytes):
+    """`atomic_write`, with the content written through `aiofiles`."""
+    with atomic_path(path) as partial:
+        async with aiofiles.open(partial, "wb") as f:
+            await f.write(content)
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from pathlib import Path, PurePosixPath
+
+from atomic import atomic_write
+from cache import CacheStore
+from manifest import BuildManifest, digest
+from search import SearchIndex
+
+
+class Baseline:
+    """
+    An earlier, already scraped edition of a manual. A new edition reuses its images, PDFs and converted pages
+    wherever they provably haven't changed, and is compared against it for a report of what did.
+    """
+
+    def __init__(self, wsm_id: str, output_path: Path, cache: CacheStore):
+        self.wsm_id = wsm_id
+        self.output_path = output_path
+        self.cache = cache
+        self.manifest = BuildManifest(output_path.joinpath("manifest.json"))
+        if not self.manifest.entries:
+            raise FileNotFoundError(f"No build manifest for the baseline {wsm_id}, build it first")
+        self.search = SearchIndex(output_path.joinpath("search.json"))
+        # Where each page ended up in the baseline, by its source filename
+        self.outputs = {PurePosixPath(key).name: key for key in self.manifest.entries if key.endswith(".md")}
+
+    async def unchanged(self, key: str, content: bytes) -> bool:
+        """Whether the baseline has the same file under the same cache key."""
+        return key in self.cache and await self.cache.digest(key) == digest(content)
+
+    async def output(self, key: str, article_map: dict[str, str], images: dict[str, str],
+                     **inputs) -> tuple[bytes, dict[str, str], dict[str, str | None], dict] | None:
+        """
+        The baseline's Markdown for `key`, the links and images it resolved and its search record, if it was generated
+        from the same inputs.
+        """
+        if key not in self.search or not self.manifest.fresh(key, article_map, images, **inputs):
+            return None
+        path = self.output_path.joinpath("docs", key)
+        if not path.exists():
+            return None
+        entry = self.manifest.get(key)
+        markdown = path.read_bytes()
+        # Someone may have edited it by hand since
+        if digest(markdown) != entry.get("output"):
+            return None
+        return markdown, entry["links"], entry.get("images", {}), self.search.get(key)
+
+    async def image(self, key: str, **inputs) -> tuple[Path, dict] | None:
+        """The baseline's encoded image for `key` and its manifest entry, if it was encoded the same way."""
+        path = self.output_path.joinpath("docs", key)
+        if not self.manifest.matches(key, **inputs) or not path.exists():
+            return None
+        entry = self.manifest.get(key)
+        if digest(await asyncio.to_thread(path.read_bytes)) != entry.get("output"):
+            return None
+        return path, entry
+
+    def changes(self, sources: dict[str, str | None]) -> dict:
+        """Compare a new edition's pages, given as their `docs/` key and source hash, against the baseline's."""
+        added, modified, moved, unchanged = [], [], [], 0
+        names = set()
+        for key, source in sorted(sources.items()):
+            name = PurePosixPath(key).name
+            names.add(name)
+            if name not in self.outputs:
+                added.append(key)
+                continue
+            old_key = self.outputs[name]
+            if self.manifest.get(old_key).get("source") != source:
+                modified.append(key)
+            elif old_key != key:
+                moved.append({"from": old_key, "to": key})
+            else:
+                unchanged += 1
+        removed = sorted(key for name, key in self.outputs.items() if name not in names)
+        return {
+            "baseline": self.wsm_id,
+            "added": added,
+            "modified": modified,
+            "moved": moved,
+            "removed": removed,
+            "unchanged": unchanged,
+        }
+
+
+def save_report(path: Path, report: dict):
+    atomic_write(path, json.dumps(report, indent=1))
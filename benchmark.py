@@ -0,0 +1,213 @@
+"""
+Benchmarks for the scraper and the converter, run against a synthetic manual served from localhost, so that changes
+to either can be compared run to run without touching the real site.
+
+    python benchmark.py                     # every benchmark
+    python benchmark.py convert mkdocs      # just these
+    python benchmark.py --json > results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import main
+import synthetic
+from mdconverter import TableConverter
+
+WSM_ID = "SYNTH-01_Ver01"
+BENCHMARKS = ["scrape", "rebuild", "convert", "mkdocs"]
+
+
+def latency(samples: list[float]) -> dict[str, float]:
+    """Milliseconds, for a per-item latency distribution."""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(1000 * statistics.median(samples), 2),
+        "p95_ms": round(1000 * samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        "max_ms": round(1000 * samples[-1], 2),
+    }
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    """
+    High-water mark of this process, or with `RUSAGE_CHILDREN` that of the largest of its children that have exited,
+    e.g. one of the conversion pool's processes. Both cover every benchmark run so far, not just the last.
+    """
+    # Kilobytes on Linux, bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss * unit / 2 ** 20, 1)
+
+
+def timed(method, samples: list[float]):
+    """Wrap a (bound) method so each call's duration is appended to `samples`."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return wrapper
+
+
+def traced_peak_mb(function) -> float:
+    """Peak Python heap use of one more call to `function`, kept apart from the timed runs it would slow down."""
+    tracemalloc.start()
+    try:
+        function()
+        return round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_scrape(site: str, output: Path, offline: bool, args) -> dict:
+    scraper = main.WSMScraper(output, WSM_ID, offline=offline, force=offline, site=site, cache=args.store,
+                              convert_workers=args.workers)
+    start = time.perf_counter()
+    asyncio.run(scraper.scrape())
+    elapsed = time.perf_counter() - start
+
+    # Stage and item timings come from the scraper's own instrumentation
+    profile = scraper.metrics.summary()
+    return {
+        "benchmark": "rebuild" if offline else "scrape",
+        "pages": len(scraper.pages),
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(scraper.pages) / elapsed, 1),
+        "stages_sec": {name.removeprefix("stage."): stats["total_s"]
+                       for name, stats in profile["latency"].items() if name.startswith("stage.")},
+        "latency": {name: stats for name, stats in profile["latency"].items()
+                    if name in ("fetch", "fetch.wait", "convert")},
+        "counters": profile["counters"],
+        "peak_rss_mb": peak_rss_mb(),
+        "pool_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def bench_convert(manual: Path, args) -> dict:
+    pages = [path.read_bytes() for path in sorted(manual.joinpath("esicont", "srvc", "html").glob("id*.html"))]
+
+    def convert_all(samples: list[float] | None = None):
+        for content in pages:
+            start = time.perf_counter()
+            TableConverter(keep_inline_images_in=['td'], bs4_options=args.parser).convert(content)
+            if samples is not None:
+                samples.append(time.perf_counter() - start)
+
+    samples = []
+    for _ in range(args.repeat):
+        convert_all(samples)
+
+    return {
+        "benchmark": "convert",
+        "pages": len(pages) * args.repeat,
+        "seconds": round(sum(samples), 3),
+        "pages_per_sec": round(len(samples) / sum(samples), 1),
+        "latency": {"convert": latency(samples)},
+        "peak_traced_mb": traced_peak_mb(convert_all),
+    }
+
+
+def synthetic_nav(rnd, depth: int, fanout: int, path: str = "") -> dict:
+    nav = {}
+    for child in range(fanout):
+        title = " ".join(rnd.choice(synthetic.WORDS) for _ in range(3))
+        location = f"{path}/{child}" if path else str(child)
+        if depth:
+            nav[title] = synthetic_nav(rnd, depth - 1, fanout, location)
+            nav[title]["INDEX"] = f"{location}/node.md"
+        else:
+            nav[title] = f"{location}/page.md"
+    return nav
+
+
+def bench_mkdocs(output: Path, args) -> dict:
+    # Forced, or every write after the first would find mkdocs.yml up to date
+    scraper = main.WSMScraper(output, WSM_ID, offline=True, force=True)
+    scraper.model = "MAZDA SYNTH"
+    # Roughly the shape of a real manual: a dozen sections, three levels of ToCs and a few thousand pages
+    scraper.nav = synthetic_nav(random.Random(0), 3, args.nav_fanout)
+    scraper.output_path.mkdir(parents=True, exist_ok=True)
+
+    samples = []
+    write = timed(scraper.write_mkdocs, samples)
+    for _ in range(args.repeat):
+        write()
+    scraper.cache.close()
+    scraper.checkpoint.close()
+
+    return {
+        "benchmark": "mkdocs",
+        "nav_entries": args.nav_fanout ** 4,
+        "seconds": round(sum(samples), 3),
+        "latency": {"write_mkdocs": latency(samples)},
+        "peak_traced_mb": traced_peak_mb(scraper.write_mkdocs),
+    }
+
+
+def report(result: dict, as_json: bool):
+    if as_json:
+        print(json.dumps(result), flush=True)
+        return
+    print(f"{result.pop('benchmark')}:")
+    for name, value in result.items():
+        if isinstance(value, dict):
+            for item, stats in value.items():
+                print(f"  {name}.{item}: {stats}")
+        else:
+            print(f"  {name}: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scraper and converter against a synthetic manual")
+    # No `choices` here: argparse rejects an empty list against them
+    parser.add_argument("benchmarks", nargs="*", metavar="{" + ",".join(BENCHMARKS) + "}",
+                        help="scrape over HTTP, rebuild offline from its cache, convert pages, write mkdocs.yml "
+                             "(default: all of them)")
+    parser.add_argument("--sections", type=int, default=4, help="top level ToC sections of the synthetic manual")
+    parser.add_argument("--depth", type=int, default=1, help="levels of nested ToCs below each section")
+    parser.add_argument("--fanout", type=int, default=5, help="child ToCs per nested ToC")
+    parser.add_argument("--pages", type=int, default=10, help="pages per innermost ToC")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay added to each response")
+    parser.add_argument("--store", default="loose", choices=["loose", "packed"])
+    parser.add_argument("--parser", default=main.HTML_PARSER, choices=["html.parser", "lxml"])
+    parser.add_argument("--workers", type=int, default=main.CONVERT_WORKERS, help="conversion processes")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the pages for the convert and mkdocs runs")
+    parser.add_argument("--nav-fanout", type=int, default=8, help="entries per nav level for the mkdocs run")
+    parser.add_argument("--json", action="store_true", help="print one JSON object per benchmark")
+    args = parser.parse_args()
+    if unknown := set(args.benchmarks) - set(BENCHMARKS):
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    args.benchmarks = args.benchmarks or BENCHMARKS
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory(prefix="wsm-benchmark-") as workdir:
+        workdir = Path(workdir)
+        manual = synthetic.SyntheticManual(args.sections, args.depth, args.fanout, args.pages)
+        manual_path = manual.generate(workdir.joinpath("site"), WSM_ID)
+
+        # The scrapes go first, as the peak RSS they report is a high-water mark for the whole process
+        with synthetic.serve(workdir.joinpath("site"), args.latency) as site:
+            # A rebuild needs the cache a scrape leaves behind
+            if "scrape" in args.benchmarks or "rebuild" in args.benchmarks:
+                result = bench_scrape(site, workdir.joinpath("wsm"), False, args)
+                if "scrape" in args.benchmarks:
+                    report(result, args.json)
+            if "rebuild" in args.benchmarks:
+                report(bench_scrape(site, workdir.joinpath("wsm"), True, args), args.json)
+        if "convert" in args.benchmarks:
+            report(bench_convert(manual_path, args), args.json)
+        if "mkdocs" in args.benchmarks:
+            report(bench_mkdocs(workdir.joinpath("mkdocs"), args), args.json)
@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import shutil
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import aiofiles
+import aiofiles.os
+
+from atomic import atomic_path, atomic_write, atomic_write_async
+
+# Images and PDFs are hashed and copied in pieces of this size rather than read whole
+CHUNK_SIZE = 1024 * 1024
+
+
+async def link_or_copy(source: Path, destination: Path):
+    """Hard-link `source` to `destination`, replacing it, or copy it where hard links aren't possible."""
+    # Already linked: replacing one link to an inode with another does nothing, and would leave the partial behind
+    if destination.exists() and await aiofiles.os.path.samefile(source, destination):
+        return
+    with atomic_path(destination) as partial:
+        try:
+            await aiofiles.os.link(source, partial)
+        except OSError:
+            # Different file systems, or one without hard links
+            await asyncio.to_thread(shutil.copyfile, source, partial)
+
+
+class CacheStore(ABC):
+    """
+    Where downloaded pages, images and PDFs are kept, addressed by their path relative to the manual's root URL
+    (e.g. `esicont/srvc/html/id0000000000.html`).
+    """
+
+    @abstractmethod
+    def __contains__(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    async def put(self, key: str, content: bytes):
+        ...
+
+    @abstractmethod
+    async def digest(self, key: str) -> str:
+        """The same hash `manifest.digest()` gives for the whole content."""
+
+    @abstractmethod
+    async def export(self, key: str, destination: Path):
+        """Put a copy of the cached file at `destination`, replacing whatever was there."""
+
+    def path(self, key: str) -> Path | None:
+        """Where the cached file can be read or edited in place, for stores that keep one."""
+        return None
+
+    async def take(self, key: str, source: "CacheStore"):
+        """Cache the file `source` has under `key`, for stores that can't take it over without reading it whole."""
+        await self.put(key, await source.get(key))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class LooseFileCache(CacheStore):
+    """The original layout: one file per URL, mirroring the site's directory structure under `root`."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def __contains__(self, key: str) -> bool:
+        return self.root.joinpath(key).is_file()
+
+    def path(self, key: str) -> Path | None:
+        return self.root.joinpath(key)
+
+    async def get(self, key: str) -> bytes:
+        async with aiofiles.open(self.root.joinpath(key), "rb") as f:
+            return await f.read()
+
+    async def put(self, key: str, content: bytes):
+        await atomic_write_async(self.root.joinpath(key), content)
+
+    async def digest(self, key: str) -> str:
+        sha256 = hashlib.sha256()
+        async with aiofiles.open(self.root.joinpath(key), "rb") as f:
+            while chunk := await f.read(CHUNK_SIZE):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    async def export(self, key: str, destination: Path):
+        # `put` always replaces a cached file with a new one instead of writing to it, so sharing the inode with
+        # `docs/` is safe
+        await link_or_copy(self.root.joinpath(key), destination)
+
+    async def take(self, key: str, source: CacheStore):
+        # Linked or streamed straight into place
+        await source.export(key, self.root.joinpath(key))
+
+
+class PackedCache(CacheStore):
+    """
+    Every cached file as a row in a single SQLite database, which avoids the per-file metadata cost of tens of
+    thousands of small files. Writes are buffered and committed in batches, and the database is memory-mapped for
+    reads.
+    """
+
+    def __init__(self, path: Path, batch_size: int = 256, batch_bytes: int = 32 * 1024 * 1024):
+        self.db_path = path
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self._pending: dict[str, bytes] = {}
+        self._pending_bytes = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA mmap_size = 1073741824")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (key TEXT PRIMARY KEY, content BLOB NOT NULL)")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._pending or self.db.execute("SELECT 1 FROM files WHERE key = ?", (key,)).fetchone() is not None
+
+    async def get(self, key: str) -> bytes:
+        if key in self._pending:
+            return self._pending[key]
+        row = self.db.execute("SELECT content FROM files WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(key)
+        return row[0]
+
+    def _chunks(self, key: str):
+        if key in self._pending:
+            yield self._pending[key]
+            return
+        row = self.db.execute("SELECT rowid FROM files WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(key)
+        with self.db.blobopen("files", "content", row[0], readonly=True) as blob:
+            while chunk := blob.read(CHUNK_SIZE):
+                yield chunk
+
+    async def digest(self, key: str) -> str:
+        sha256 = hashlib.sha256()
+        for chunk in self._chunks(key):
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    async def export(self, key: str, destination: Path):
+        atomic_write(destination, self._chunks(key))
+
+    async def put(self, key: str, content: bytes):
+        self._pending[key] = content
+        self._pending_bytes += len(content)
+        if len(self._pending) >= self.batch_size or self._pending_bytes >= self.batch_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?)", self._pending.items())
+        self._pending.clear()
+        self._pending_bytes = 0
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+def open_cache(kind: str, root: Path) -> CacheStore:
+    match kind:
+        case "loose":
+            return LooseFileCache(root)
+        case "packed":
+            return PackedCache(root.joinpath("cache.sqlite"))
+        case _:
+            raise NotImplementedError(f"Unsupported cache store: {kind}")
+
+
+class AssetStore:
+    """
+    Images and PDFs stored once per distinct content, under their SHA-256, for any number of manuals. `refs` records
+    which file each manual's cache key holds, so identical files from different manuals (or from different places in
+    one) take up disk space only once.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._pending: dict[tuple[str, str], str] = {}
+
+        root.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(root.joinpath("refs.sqlite"))
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS refs (namespace TEXT NOT NULL, key TEXT NOT NULL, "
+                        "digest TEXT NOT NULL, PRIMARY KEY (namespace, key))")
+
+    def path(self, digest: str) -> Path:
+        return self.root.joinpath(digest[:2], digest)
+
+    def digest(self, namespace: str, key: str) -> str | None:
+        if (namespace, key) in self._pending:
+            return self._pending[(namespace, key)]
+        row = self.db.execute("SELECT digest FROM refs WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return row[0] if row else None
+
+    async def put(self, namespace: str, key: str, content: bytes):
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.path(digest)
+        if not path.exists():
+            await atomic_write_async(path, content)
+        self._pending[(namespace, key)] = digest
+
+    def ref(self, namespace: str, key: str, digest: str):
+        """Record that `key` holds a file the store already has."""
+        self._pending[(namespace, key)] = digest
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO refs VALUES (?, ?, ?)",
+                                [(namespace, key, digest) for (namespace, key), digest in self._pending.items()])
+        self._pending.clear()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+class SharedAssetCache(CacheStore):
+    """
+    One manual's cache, with its images and PDFs kept in a shared `AssetStore` and everything else (the HTML) in
+    `pages`. Assets cached before the store was in use are still read from `pages`.
+    """
+
+    def __init__(self, pages: CacheStore, assets: AssetStore, namespace: str):
+        self.pages = pages
+        self.assets = assets
+        self.namespace = namespace
+
+    def _asset(self, key: str) -> str | None:
+        return None if key.endswith(".html") else self.assets.digest(self.namespace, key)
+
+    def __contains__(self, key: str) -> bool:
+        return self._asset(key) is not None or key in self.pages
+
+    def path(self, key: str) -> Path | None:
+        if digest := self._asset(key):
+            return self.assets.path(digest)
+        return self.pages.path(key)
+
+    async def get(self, key: str) -> bytes:
+        if digest := self._asset(key):
+            async with aiofiles.open(self.assets.path(digest), "rb") as f:
+                return await f.read()
+        return await self.pages.get(key)
+
+    async def put(self, key: str, content: bytes):
+        if key.endswith(".html"):
+            await self.pages.put(key, content)
+        else:
+            await self.assets.put(self.namespace, key, content)
+
+    async def take(self, key: str, source: CacheStore):
+        if (isinstance(source, SharedAssetCache) and source.assets is self.assets and
+                (digest := source._asset(key)) and not key.endswith(".html")):
+            # Already in the store, so it only needs another reference
+            self.assets.ref(self.namespace, key, digest)
+        elif key.endswith(".html"):
+            await self.pages.take(key, source)
+        else:
+            await super().take(key, source)
+
+    async def digest(self, key: str) -> str:
+        # Content addressed, so there is nothing to hash
+        return self._asset(key) or await self.pages.digest(key)
+
+    async def export(self, key: str, destination: Path):
+        if digest := self._asset(key):
+            # Objects are never written to once in place, so they can be linked into `docs/`
+            await link_or_copy(self.assets.path(digest), destination)
+        else:
+            await self.pages.export(key, destination)
+
+    def flush(self):
+        self.pages.flush()
+        self.assets.flush()
+
+    def close(self):
+        # The asset store is shared with other manuals, so it is left for its owner to close
+        self.pages.close()
+        self.assets.flush()
@@ -0,0 +1,79 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+
+class Checkpoint:
+    """
+    Crawl state kept in SQLite, so that an interrupted crawl can pick up where it stopped instead of walking the whole
+    ToC again.
+
+    Changes are buffered and committed together every `interval` seconds. Since they are committed in the order they
+    happened, the database always holds a consistent snapshot: a frontier item is only dropped in the same
+    transaction that records the page it produced and the items it discovered.
+    """
+
+    def __init__(self, path: Path, interval: float = 5.0):
+        self.path = path
+        self.interval = interval
+        self._pending: list[tuple[str, tuple]] = []
+        self._flushed = time.monotonic()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, kind TEXT NOT NULL, breadcrumbs TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, children TEXT NOT NULL, pdf TEXT);
+            CREATE TABLE IF NOT EXISTS images (page TEXT PRIMARY KEY, keys TEXT NOT NULL);
+        """)
+
+    def get_state(self, key: str):
+        row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_state(self, key: str, value):
+        self._pending.append(("INSERT OR REPLACE INTO state VALUES (?, ?)", (key, json.dumps(value))))
+
+    def seen(self) -> set[str]:
+        return {key for key, in self.db.execute("SELECT key FROM seen")}
+
+    def frontier(self) -> list[tuple[str, str, list[str]]]:
+        return [(kind, url, json.loads(breadcrumbs))
+                for url, kind, breadcrumbs in self.db.execute("SELECT url, kind, breadcrumbs FROM frontier")]
+
+    def pages(self) -> dict[str, tuple[list[tuple[str, str]], str | None, list[str]]]:
+        return {key: ([tuple(child) for child in json.loads(children)], pdf, json.loads(images or "[]"))
+                for key, children, pdf, images in self.db.execute(
+                    "SELECT key, children, pdf, keys FROM pages LEFT JOIN images ON images.page = pages.key")}
+
+    def enqueued(self, key: str, kind: str, url: str, breadcrumbs: list[str]):
+        self._pending.append(("INSERT OR IGNORE INTO seen VALUES (?)", (key,)))
+        self._pending.append(("INSERT OR REPLACE INTO frontier VALUES (?, ?, ?)", (url, kind, json.dumps(breadcrumbs))))
+
+    def completed(self, url: str):
+        self._pending.append(("DELETE FROM frontier WHERE url = ?", (url,)))
+
+    def crawled(self, key: str, children: list[tuple[str, str]], pdf: str | None, images: list[str]):
+        self._pending.append(("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", (key, json.dumps(children), pdf)))
+        self._pending.append(("INSERT OR REPLACE INTO images VALUES (?, ?)", (key, json.dumps(images))))
+
+    def due(self) -> bool:
+        return time.monotonic() - self._flushed >= self.interval
+
+    def flush(self):
+        with self.db:
+            for statement, parameters in self._pending:
+                self.db.execute(statement, parameters)
+        self._pending.clear()
+        self._flushed = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def remove(self):
+        self.db.close()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from metrics import Metrics
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:140.0) Gecko/20100101 Firefox/140.0"
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit that grows by one request per round trip while the server keeps up, and halves as soon as it
+    pushes back: a 429/5xx, a transport error, or a latency well above the best one seen so far.
+    """
+
+    def __init__(self, initial: int, maximum: int, minimum: int = 1, backoff: float = 0.5,
+                 latency_tolerance: float = 3.0):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.latency: float | None = None
+        self.best_latency: float | None = None
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def succeeded(self, latency: float):
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        self.best_latency = latency if self.best_latency is None else min(self.best_latency, latency)
+
+        if self.latency > self.best_latency * self.latency_tolerance:
+            self.congested()
+        else:
+            # Additive increase: one extra slot once a whole window's worth of requests has succeeded
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def congested(self):
+        # Responses to requests sent before the last decrease still reflect the old limit, so don't react to them
+        # again straight away
+        now = time.monotonic()
+        if now - self._last_decrease < (self.latency or 0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        logging.info(f"Server is pushing back, concurrency limit lowered to {int(self.limit)}")
+
+
+class RateLimiter:
+    """Token bucket per host, allowing short bursts of up to `burst` requests."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host: str):
+        async with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            delay = max(0.0, (1 - tokens) / self.rate)
+            # Taking the token up front keeps requests queued behind this one spaced out as well
+            self._buckets[host] = (tokens - 1, now)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class Fetcher:
+    """
+    HTTP GETs with a sized connection pool, timeouts, optional per-host rate limiting, retries with exponential
+    backoff and an AIMD concurrency limit. Only successful responses are returned, so nothing broken ends up in the
+    cache.
+    """
+
+    def __init__(self, concurrency: int = 4, max_concurrency: int = 16, rate: float | None = None,
+                 retries: int = 3, backoff: float = 1.0, timeout: float = 30.0, http2: bool = False):
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = AIMDLimiter(concurrency, max_concurrency)
+        self.rate_limiter = RateLimiter(rate, burst=max(1, int(rate))) if rate else None
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+            http2=http2,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+
+    def retry_delay(self, attempt: int, response: httpx.Response | None) -> float:
+        if response is not None and (retry_after := response.headers.get("Retry-After")):
+            if retry_after.isdigit():
+                return float(retry_after)
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+        return self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    async def get(self, url: httpx.URL | str, metrics: Metrics | None = None) -> httpx.Response:
+        """
+        Fetch `url`. If `metrics` are given, each attempt's time to first byte goes into them as `fetch`, kept apart
+        from the time spent waiting for a slot or the rate limit (`fetch.wait`) and between retries (`fetch.backoff`).
+        """
+        url = httpx.URL(url)
+        for attempt in range(self.retries + 1):
+            queued = time.monotonic()
+            if self.rate_limiter:
+                await self.rate_limiter.wait(url.host)
+
+            response = None
+            async with self.limiter.slot():
+                start = time.monotonic()
+                if metrics:
+                    metrics.observe("fetch.wait", start - queued)
+                try:
+                    async with self.client.stream("GET", url) as response:
+                        # Time to first byte rather than total time, so that large PDFs don't look like congestion
+                        latency = time.monotonic() - start
+                        if metrics:
+                            metrics.observe("fetch", latency)
+                        await response.aread()
+                except httpx.TransportError as e:
+                    self.limiter.congested()
+                    error = e
+                else:
+                    if response.status_code == 429 or response.status_code >= 500:
+                        self.limiter.congested()
+                        error = httpx.HTTPStatusError(f"{response.status_code} for {url}", request=response.request,
+                                                      response=response)
+                    else:
+                        self.limiter.succeeded(latency)
+                        # Anything else that isn't a success won't get better by asking again
+                        return response.raise_for_status()
+
+            if attempt < self.retries:
+                delay = self.retry_delay(attempt, response)
+                logging.warning(f"{error!r} fetching {url}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                if metrics:
+                    metrics.observe("fetch.backoff", delay)
+
+        raise error
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
@@ -0,0 +1,51 @@
+import importlib.metadata
+import inspect
+import io
+from dataclasses import dataclass
+
+from PIL import Image as PILImage
+
+from manifest import digest
+
+# "png" recompresses losslessly, "webp" converts to lossless WebP and "copy" keeps the original bytes
+IMAGE_FORMATS = ["png", "webp", "copy"]
+
+
+@dataclass(frozen=True, slots=True)
+class Image:
+    """Where an image ended up under `docs/images/`, and its size in pixels."""
+    file: str
+    width: int
+    height: int
+
+    @property
+    def ref(self) -> str:
+        # What the build manifest records for every page showing the image
+        return f"{self.file} {self.width}x{self.height}"
+
+
+def image_file(name: str, image_format: str) -> str:
+    return name.rsplit(".", 1)[0] + ".webp" if image_format == "webp" else name
+
+
+def encoder_version(image_format: str) -> str:
+    """Fingerprint of the encoder settings: changing them encodes every image again."""
+    return digest(image_format + inspect.getsource(encode_image) + importlib.metadata.version("pillow"))
+
+
+def encode_image(content: bytes, image_format: str) -> tuple[bytes, int, int]:
+    """Losslessly recompress an image, or convert it to lossless WebP, in a pool process. Returns it with its size."""
+    with PILImage.open(io.BytesIO(content)) as image:
+        width, height = image.size
+        if image_format == "copy":
+            return content, width, height
+        output = io.BytesIO()
+        if image_format == "webp":
+            image.save(output, "WEBP", lossless=True, method=6)
+        else:
+            image.save(output, "PNG", optimize=True)
+    encoded = output.getvalue()
+    # Whatever wrote the original may have done better already
+    if image_format == "png" and len(encoded) >= len(content):
+        encoded = content
+    return encoded, width, height
@@ -1,63 +1,203 @@
+import argparse
 import asyncio
+import functools
+import importlib.metadata
+import inspect
+import json
 import logging
 import os
 import re
-from asyncio import Queue, TaskGroup
-from pathlib import Path, PurePath
+import shutil
+import sys
+import time
+from asyncio import TaskGroup
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path, PurePath, PurePosixPath
 
 import aiofiles
-import aiofiles.os
 import httpx
 import yaml
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
 from slugify import slugify
 
+import mdconverter
+import search
+from atomic import atomic_path, atomic_write, atomic_write_async
+from baseline import Baseline, save_report
+from cache import AssetStore, CacheStore, SharedAssetCache, link_or_copy, open_cache
+from checkpoint import Checkpoint
+from fetcher import Fetcher
+from images import IMAGE_FORMATS, Image, encode_image, encoder_version, image_file
+from manifest import BuildManifest, digest
+from metrics import Metrics, Progress
 from mdconverter import TableConverter
+from scheduler import Scheduler
+from search import SearchIndex, search_record
 
 logging.basicConfig(level=logging.INFO)
 
+SITE = "https://mazdamanuals.com.au"
+# Initial and maximum number of requests in flight - the fetcher adapts between the two as the server allows
 CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+CONVERT_WORKERS = int(os.environ.get("CONVERT_WORKERS", os.cpu_count() or 1))
+# BeautifulSoup tree builder used for every page, e.g. "lxml" for speed if it is installed
+HTML_PARSER = os.environ.get("HTML_PARSER", "html.parser")
+# Work lanes of the crawl and the build, highest priority first. Pages come before the images and PDFs they name as
+# they lead to more work, and local copies before downloads. Images come before the pages waiting for them.
+CRAWL_LANES = ["page", "baseline-asset", "asset"]
+BUILD_LANES = ["image", "convert"]
+# Link discovery only looks at these tags, so the crawl never builds a full tree of a page - the one full parse
+# happens during conversion
+DISCOVERY_TAGS = SoupStrainer(["a", "img", "script"])
 
 class UnseenLinkError(KeyError):
     pass
 
+def parse_html(content: bytes, parser: str, **kwargs) -> BeautifulSoup:
+    # Decoded the same way whichever tree builder is used, as lxml guesses differently at pages declaring no charset
+    return BeautifulSoup(UnicodeDammit(content, is_html=True).unicode_markup, parser, **kwargs)
+
 def url_replace_leaf(url: httpx.URL, new_leaf: str) -> httpx.URL:
     return url.copy_with(path=str(PurePath(url.path).parent.joinpath(new_leaf)))
 
-def listify_dict(d: dict) -> list:
-    result = []
-
-    capitalized = {
-        "DTC", "OBD", "VIN", "EGR", "PCV", "LF", "MAF", "IAT", "CPP", "PSP", "ECT", "PCM", "CKP", "CMP", "TP", "APP",
-        "HO2S", "MAP", "KS", "BARO", "SST", "ABS", "DSC", "HU", "CM", "VSS", "TR", "ATF", "KOEO", "KOER", "PID", "CD",
-        "MP3", "AudioPilot", "ALC", "BOSE", "MIL", "AT", "MT", "WM", "SJ6A", "EL", "ESA", "EVAP", "OCV"
-    }
-
-    for key, value in d.items():
-        key = key.title()
-
-        for cap in capitalized:
-            key = re.sub(rf"{cap.capitalize()}(\W)", rf"{cap}\g<1>", key)
-
+# Acronyms that `str.title()` mangles in nav titles
+CAPITALIZED = {
+    "DTC", "OBD", "VIN", "EGR", "PCV", "LF", "MAF", "IAT", "CPP", "PSP", "ECT", "PCM", "CKP", "CMP", "TP", "APP",
+    "HO2S", "MAP", "KS", "BARO", "SST", "ABS", "DSC", "HU", "CM", "VSS", "TR", "ATF", "KOEO", "KOER", "PID", "CD",
+    "MP3", "AudioPilot", "ALC", "BOSE", "MIL", "AT", "MT", "WM", "SJ6A", "EL", "ESA", "EVAP", "OCV"
+}
+# All of them put back in a single pass, each where it's followed by a non-word character
+ACRONYMS = {cap.capitalize(): cap for cap in CAPITALIZED}
+ACRONYM_PATTERN = re.compile(rf"({'|'.join(sorted(ACRONYMS, key=len, reverse=True))})(\W)")
+STR_TAG = "tag:yaml.org,2002:str"
+# The C emitter if PyYAML was built with libyaml
+YAML_DUMPER = getattr(yaml, "CDumper", yaml.Dumper)
+_resolver = yaml.resolver.Resolver()
+
+@functools.cache
+def nav_title(key: str) -> str:
+    return ACRONYM_PATTERN.sub(lambda match: ACRONYMS[match[1]] + match[2], key.title())
+
+def yaml_scalar(value: str) -> yaml.ScalarEvent:
+    # Quoted only if it would read back as anything but a string, as `yaml.dump` does
+    plain = _resolver.resolve(yaml.ScalarNode, value, (True, False)) == STR_TAG
+    return yaml.ScalarEvent(None, STR_TAG, (plain, True), value)
+
+def yaml_events(value):
+    """YAML events for a tree of dicts, lists and strings, laid out the way `yaml.dump` would."""
+    if isinstance(value, dict):
+        yield yaml.MappingStartEvent(None, None, True, flow_style=False)
+        for key in sorted(value):
+            yield yaml_scalar(key)
+            yield from yaml_events(value[key])
+        yield yaml.MappingEndEvent()
+    elif isinstance(value, list):
+        yield yaml.SequenceStartEvent(None, None, True, flow_style=False)
+        for item in value:
+            yield from yaml_events(item)
+        yield yaml.SequenceEndEvent()
+    else:
+        yield yaml_scalar(value)
+
+def nav_events(nav: dict):
+    """
+    The nav as MkDocs wants it, a list of single entry mappings in ToC order, emitted straight from the nav tree
+    instead of being built as one first.
+    """
+    yield yaml.SequenceStartEvent(None, None, True, flow_style=False)
+    for key, value in nav.items():
+        yield yaml.MappingStartEvent(None, None, True, flow_style=False)
+        yield yaml_scalar(nav_title(key))
         if isinstance(value, dict):
-            result.append({
-                key: listify_dict(value)
-            })
+            yield from nav_events(value)
         else:
-            result.append({
-                key: value
-            })
-
-    return result
+            yield yaml_scalar(value)
+        yield yaml.MappingEndEvent()
+    yield yaml.SequenceEndEvent()
+
+def mkdocs_events(config: dict, nav: dict):
+    yield yaml.StreamStartEvent()
+    yield yaml.DocumentStartEvent(explicit=False)
+    yield yaml.MappingStartEvent(None, None, True, flow_style=False)
+    for key in sorted(config.keys() | {"nav"}):
+        yield yaml_scalar(key)
+        yield from nav_events(nav) if key == "nav" else yaml_events(config[key])
+    yield yaml.MappingEndEvent()
+    yield yaml.DocumentEndEvent(explicit=False)
+    yield yaml.StreamEndEvent()
+
+def breadcrumb_trail(nav: dict, breadcrumbs: list[str]) -> str:
+    title = ''
+    leaf = nav
+    parents = len(breadcrumbs)
+    for part in breadcrumbs:
+        leaf = leaf[part]
+        filename = '../' * parents
+        if isinstance(leaf, str):
+            filename += leaf
+        elif isinstance(leaf, dict):
+            if 'INDEX' not in leaf:
+                raise UnseenLinkError()
+            filename += leaf['INDEX']
+        title += ' ➭ ' + f"[{part}]({filename})"
+    return title.removeprefix(' ➭ ')
+
+class LinkIndex:
+    """
+    Where everything in `article_map` ends up under `docs/`, split into path components once after the crawl. Links
+    between two files are then worked out from their common prefix and remembered, rather than rebuilt with pathlib
+    for every link on every page.
+    """
+
+    def __init__(self, article_map: dict[str, str]):
+        self.article_map = article_map
+        self.parts = {name: PurePath(location).parts for name, location in article_map.items()}
+        self._targets: dict[str, tuple[str, str]] = {}
+        self._links: dict[tuple[tuple[str, ...], str], str] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.article_map
+
+    def directory(self, name: str) -> tuple[str, ...]:
+        return self.parts[name][:-1]
+
+    def target(self, href: str) -> tuple[str, str]:
+        """The `article_map` name an href points at, and its `#fragment` if it has one."""
+        if (target := self._targets.get(href)) is None:
+            path = href.lstrip('.').lstrip('/')
+            fragment = f"#{path.split('#')[1]}" if '#' in path else ''
+            target = self._targets[href] = (path.split('#')[0].replace('.html', '.md'), fragment)
+        return target
+
+    def relative(self, directory: tuple[str, ...], name: str) -> str:
+        """Relative link from a page in `directory` to `name`."""
+        if (link := self._links.get((directory, name))) is None:
+            parts = self.parts[name]
+            common = 0
+            while common < len(directory) and common < len(parts) and directory[common] == parts[common]:
+                common += 1
+            link = '../' * (len(directory) - common) + ('/'.join(parts[common:]) or '.')
+            self._links[(directory, name)] = link
+        return link
 
 class WSMMarkdownConverter(TableConverter):
-    def __init__(self, article_map: dict[str, str], nav: dict, breadcrumbs: list[str], filename: str, **kwargs):
+    def __init__(self, index: LinkIndex, nav: dict, breadcrumbs: list[str], filename: str,
+                 pdf: str | None = None, images: dict[str, Image] | None = None, **kwargs):
         super().__init__(keep_inline_images_in=['td'], **kwargs)
-        self.article_map = article_map
+        self.index = index
         self.nav = nav
         self.breadcrumbs = breadcrumbs
         self.filename = filename
-        self.path = PurePath(self.article_map[self.filename]).parent
+        # The PDF opened by this page's `javascript:Open()` links, if any
+        self.pdf = pdf
+        self.directory = index.directory(self.filename)
+        # Every `article_map` entry the output depends on, so the build manifest can tell when it goes stale
+        self.links: dict[str, str] = {self.filename: index.article_map[self.filename]}
+        # Deduplicated and re-encoded images by their original name, and the ones this page shows
+        self.images = images or {}
+        self.image_refs: dict[str, str | None] = {}
 
     def convert_dd(self, el, text, parent_tags):
         return text.strip()
@@ -67,17 +207,13 @@ class WSMMarkdownConverter(TableConverter):
 
     def convert_a(self, el, text, parent_tags):
         if href := el.get('href'):
+            if href == 'javascript:Open()' and self.pdf:
+                href = self.pdf
             if not href.startswith('#'):
-                href = href.lstrip('.').lstrip('/')
-                fragment = f"#{href.split('#')[1]}" if '#' in href else ''
-                href = href.split('#')[0].replace('.html', '.md')
-                if href in self.article_map:
-                    prefix = ''
-                    path = self.path
-                    while not PurePath(self.article_map[href]).is_relative_to(path):
-                        prefix += '../'
-                        path = path.parent
-                    el.attrs['href'] = prefix + str(PurePath(self.article_map[href]).relative_to(path)) + fragment
+                href, fragment = self.index.target(href)
+                if href in self.index:
+                    self.links[href] = self.index.article_map[href]
+                    el.attrs['href'] = self.index.relative(self.directory, href) + fragment
                 else:
                     raise UnseenLinkError(href)
 
@@ -85,173 +221,445 @@ class WSMMarkdownConverter(TableConverter):
 
     def convert_img(self, el, text, parent_tags):
         src = el.get('src')
+        image = None
         if src:
+            name = PurePath(src).name
+            image = self.images.get(name)
+            self.image_refs[name] = image.ref if image else None
             # Calculate the relative path to the `images/` folder
-            el.attrs['src'] = '../' * len(self.path.parts) + 'images/' + PurePath(src).name
+            el.attrs['src'] = '../' * len(self.directory) + 'images/' + (image.file if image else name)
             # if 'table' in parent_tags:
             #     # The extra `../` is MkDocs-specific, and actually breaks viewing Markdown locally!
             #     el.attrs['src'] = '../' + el.attrs['src']
-        return super().convert_img(el, text, parent_tags)
-
-    def convert(self, html):
-        title = ''
-        leaf = self.nav
-        parents = len(self.breadcrumbs)
-        for part in self.breadcrumbs:
-            leaf = leaf[part]
-            filename = '../' * parents
-            if isinstance(leaf, str):
-                filename += leaf
-            elif isinstance(leaf, dict):
-                if 'INDEX' not in leaf:
-                    raise UnseenLinkError()
-                filename += leaf['INDEX']
-            title += ' ➭ ' + f"[{part}]({filename})"
-        return title.removeprefix(' ➭ ') + '\n\n' + super().convert(html)
+        markdown = super().convert_img(el, text, parent_tags)
+        if image and markdown.startswith('!['):
+            # Reserves the image's space before it loads, which only happens once it's scrolled near (`attr_list`)
+            markdown += f'{{: loading=lazy width={image.width} height={image.height} }}'
+        return markdown
+
+    def convert_soup(self, soup):
+        return breadcrumb_trail(self.nav, self.breadcrumbs) + '\n\n' + super().convert_soup(soup)
+
+def converter_version() -> str:
+    """Fingerprint of the conversion rules: changing any of them invalidates every previously converted page."""
+    return digest(
+        inspect.getsource(mdconverter) + inspect.getsource(breadcrumb_trail) +
+        inspect.getsource(LinkIndex) + inspect.getsource(WSMMarkdownConverter) + importlib.metadata.version("markdownify") +
+        inspect.getsource(search)
+    )
+
+# Snapshot of the link index and nav used by `convert_page` in pool workers, installed once per process by
+# `init_converter` rather than pickled along with every page
+_index = LinkIndex({})
+_nav: dict = {}
+_parser = HTML_PARSER
+
+def init_converter(index: LinkIndex, nav: dict, parser: str = HTML_PARSER):
+    global _index, _nav, _parser
+    _index = index
+    _nav = nav
+    _parser = parser
+
+def convert_page(breadcrumbs: list[str], filename: str, content: bytes, pdf: str | None = None,
+                 images: dict[str, tuple[str, int, int]] | None = None
+                 ) -> tuple[str, dict[str, str], dict[str, str | None], dict, dict[str, list[float]]]:
+    # Images come as plain tuples: an `Image` made before `watch.py` reloaded the rules couldn't be pickled any more
+    images = {name: Image(*image) for name, image in (images or {}).items()}
+    converter = WSMMarkdownConverter(_index, _nav, breadcrumbs, filename, pdf=pdf, images=images,
+                                     bs4_options=_parser)
+    # Parsed separately from the conversion so the two can be timed apart; the timings go back to the main
+    # process along with the result
+    start = time.perf_counter()
+    soup = parse_html(content, _parser)
+    parsed = time.perf_counter()
+    # Taken before the conversion, which adds anchors of its own to the tree
+    record = search_record(soup, breadcrumbs)
+    indexed = time.perf_counter()
+    markdown = converter.convert_soup(soup)
+    timings = {
+        "convert.parse": [parsed - start],
+        "convert.search": [indexed - parsed],
+        "convert.markdown": [time.perf_counter() - indexed],
+        "convert.render_table": converter.table_timings,
+    }
+    return markdown, converter.links, converter.image_refs, record, timings
+
+@dataclass
+class CrawledPage:
+    # Links to ToC entries (`main` and `fraToc` targets) in document order, with their titles
+    children: list[tuple[str, str]] = field(default_factory=list)
+    pdf: str | None = None
+    # Cache keys of the images it shows
+    images: list[str] = field(default_factory=list)
 
 class WSMScraper:
-    def __init__(self, wsm_cache="wsm", wsm_id="D933-1A-22C_Ver26"):
+    def __init__(self, wsm_cache="wsm", wsm_id="D933-1A-22C_Ver26", convert_workers=CONVERT_WORKERS,
+                 offline=False, force=bool(os.environ.get("FORCE_MARKDOWN", False)), parser=HTML_PARSER,
+                 fetcher: Fetcher | None = None, cache: str = "loose", site: str = SITE, progress: bool = False,
+                 assets: AssetStore | None = None, baseline: str | None = None, image_format: str = "png"):
         self.output_path = Path(wsm_cache) / Path(wsm_id)
         self.wsm_id = wsm_id
         self.base_uri = f"/wsm-secure/WSM/{self.wsm_id}/"
-        self.start_url = "https://mazdamanuals.com.au" + self.base_uri
-        self.session = httpx.AsyncClient(headers={
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:140.0) Gecko/20100101 Firefox/140.0"
-        },
-        follow_redirects=True)
+        self.start_url = site + self.base_uri
+        self.owns_fetcher = fetcher is None
+        self.fetcher = fetcher or Fetcher(CONCURRENCY, MAX_CONCURRENCY)
         self.seen = set()
         self.article_map: dict[str, str] = {}
         self.nav: dict = {}
-        self.md_queue = Queue()
+        self.model = None
+        self.convert_workers = convert_workers
+        # Offline runs only ever read from the cache, and `force` rewrites outputs that already exist
+        self.offline = offline
+        self.force = force
+        self.parser = parser
+        self.manifest = BuildManifest(self.output_path.joinpath("manifest.json"))
+        self.search = SearchIndex(self.output_path.joinpath("search.json"))
+        self.converter_version = converter_version()
+        self.cache: CacheStore = open_cache(cache, self.output_path)
+        if assets:
+            # Images and PDFs go into a store shared with other manuals instead
+            self.cache = SharedAssetCache(self.cache, assets, wsm_id)
+        self.baseline: Baseline | None = None
+        if baseline:
+            # An earlier edition to take unchanged files from; its cache may be either kind
+            baseline_path = Path(wsm_cache) / Path(baseline)
+            baseline_cache = open_cache("packed" if baseline_path.joinpath("cache.sqlite").exists() else "loose",
+                                        baseline_path)
+            if assets:
+                baseline_cache = SharedAssetCache(baseline_cache, assets, baseline)
+            self.baseline = Baseline(baseline, baseline_path, baseline_cache)
+        self.checkpoint = Checkpoint(self.output_path.joinpath("checkpoint.sqlite"))
+        self.frontier = Scheduler(CRAWL_LANES)
+        self.crawled: dict[str, CrawledPage] = {}
+        # Pages discovered by the crawl, converted only once the link map and nav are complete
+        self.pages: list[tuple[list[str], str, Path, str | None]] = []
+        self.work: Scheduler | None = None
+        # Every image the pages show by its name, and where it ended up once deduplicated and encoded
+        self.image_keys: dict[str, str] = {}
+        self.images: dict[str, Image] = {}
+        self.image_refs: dict[str, str] = {}
+        self.image_format = image_format
+        self.encoder_version = encoder_version(image_format)
+        self.metrics = Metrics()
+        self.progress = Progress() if progress else None
+
+    def register(self, breadcrumbs: list[str], filename: PurePosixPath) -> Path:
+        logging.debug(breadcrumbs)
+        location = '/'.join(slugify(part) for part in breadcrumbs)
+        self.article_map[filename.name] = location + '/' + filename.name
+        logging.debug(location)
+
+        match filename.suffix:
+            case ".md":
+                leaf = self.nav
+                parent = leaf
+                part = None
+                for part in breadcrumbs:
+                    if not part in leaf:
+                        leaf[part] = {}
+                    parent = leaf
+                    leaf = leaf[part]
+                if not filename.name.startswith("left_menu") and not filename.name.startswith("node"):
+                    # This is needed for some edge cases where the ToC contains two different links with the same name
+                    while part in parent and isinstance(parent[part], str) and parent[part] != location + '/' + filename.name:
+                        part = part + ' '
+                    parent[part] = location + '/' + filename.name
+                else:
+                    if not parent[part] or 'INDEX' not in parent[part]:
+                        parent[part]["INDEX"] = location + '/' + filename.name
+                return self.output_path.joinpath("docs").joinpath(location).joinpath(filename.name).with_suffix(".md")
+            case ".png":
+                return self.output_path.joinpath("docs").joinpath("images").joinpath(filename.name).with_suffix(".png")
+            case ".pdf":
+                return self.output_path.joinpath("docs").joinpath("pdf").joinpath(filename.name).with_suffix(".pdf")
+            case _:
+                raise NotImplementedError(f"Unsupported filename: {filename}")
+
+    async def write(self, filename: Path, content: bytes):
+        with self.metrics.time("write"):
+            logging.info(f"Writing docs: {filename}")
+            await atomic_write_async(filename, content)
+        self.metrics.count("write.files")
+        self.metrics.count("write.bytes", len(content))
+
+    async def holds(self, filename: Path, content_digest: str) -> bool:
+        """Whether `filename` exists with exactly the content `content_digest` is the digest of."""
+        try:
+            async with aiofiles.open(filename, "rb") as f:
+                return digest(await f.read()) == content_digest
+        except FileNotFoundError:
+            return False
+
+    def docs_key(self, output: Path) -> str:
+        return output.relative_to(self.output_path.joinpath("docs")).as_posix()
+
+    async def markdownify(self, pool: ProcessPoolExecutor, breadcrumbs: list[str], source_key: str, output: Path,
+                          pdf: str | None = None):
+        filename = PurePosixPath(source_key).with_suffix('.md')
+        key = self.docs_key(output)
+        content = await self.cache.get(source_key)
+        source = digest(content)
 
-    async def markdownify(self, breadcrumbs: list[str], filename: Path, content: bytes, retries: int = CONCURRENCY + 1):
         try:
-            logging.debug(breadcrumbs)
-            location = '/'.join(slugify(part) for part in breadcrumbs)
-            self.article_map[filename.name] = location + '/' + filename.name
-            logging.debug(location)
-
-            match filename.suffix:
-                case ".md":
-                    leaf = self.nav
-                    parent = leaf
-                    part = None
-                    for part in breadcrumbs:
-                        if not part in leaf:
-                            leaf[part] = {}
-                        parent = leaf
-                        leaf = leaf[part]
-                    if not filename.name.startswith("left_menu") and not filename.name.startswith("node"):
-                        # This is needed for some edge cases where the ToC contains two different links with the same name
-                        while part in parent and isinstance(parent[part], str) and parent[part] != location + '/' + filename.name:
-                            part = part + ' '
-                        parent[part] = location + '/' + filename.name
-                    else:
-                        if not parent[part] or 'INDEX' not in parent[part]:
-                            parent[part]["INDEX"] = location + '/' + filename.name
-                    content = WSMMarkdownConverter(self.article_map, self.nav, breadcrumbs, filename.name).convert(content).encode("utf-8")
-                    filename = self.output_path.joinpath("docs").joinpath(location).joinpath(filename.name).with_suffix(
-                        ".md")
-                case ".png":
-                    filename = self.output_path.joinpath("docs").joinpath("images").joinpath(filename.name).with_suffix(".png")
-                case ".pdf":
-                    filename = self.output_path.joinpath("docs").joinpath("pdf").joinpath(filename.name).with_suffix(".pdf")
-                    self.article_map["javascript:Open()"] = self.article_map[filename.name]
-                case _:
-                    raise NotImplementedError(f"Unsupported filename: {filename}")
-
-            if filename.exists() and not os.environ.get("FORCE_MARKDOWN", False):
+            trail = digest(breadcrumb_trail(self.nav, breadcrumbs))
+
+            # Skip the page if neither its HTML, its place in the nav, the conversion rules nor any of the links it
+            # resolved have changed since it was last written
+            inputs = dict(source=source, trail=trail, converter=self.converter_version, parser=self.parser)
+            if (not self.force and output.exists() and key in self.search and
+                    self.manifest.fresh(key, self.article_map, self.image_refs, **inputs)):
+                self.metrics.count("convert.fresh")
                 return
 
-            await aiofiles.os.makedirs(os.path.dirname(filename), exist_ok=True)
-            async with aiofiles.open(filename, "wb") as f:
-                logging.info(f"Writing docs: {filename}")
-                await f.write(content)
-        except UnseenLinkError as e:
-            # This happens if the file contains links to other files that haven't been processed yet. We need to
-            # enqueue another call to `markdownify` with the same parameters - by the time it's called, the missing
-            # links should have been processed already.
-            if retries > 0:
-                await self.md_queue.put(self.markdownify(breadcrumbs, filename, content, retries - 1))
+            # The same goes for the page in the edition this one is compared against, unless rebuilding everything
+            if (self.baseline and not self.force and
+                    (reused := await self.baseline.output(key, self.article_map, self.image_refs, **inputs))):
+                markdown, links, images, record = reused
+                self.metrics.count("baseline.pages")
             else:
-                logging.error(f"Couldn't figure out the link {e} while processing {filename.name}")
-        finally:
-            self.md_queue.task_done()
-
-    async def download(self, url: httpx.URL) -> (Path, bytes):
-        filename = self.output_path.joinpath(url.path.replace(self.base_uri, ''))
+                # Only the images this page shows go along with it, they're all encoded by now
+                images = {name: (image.file, image.width, image.height) for name in self.page_images(source_key)
+                          if (image := self.images.get(name))}
+                with self.metrics.time("convert"):
+                    markdown, links, images, record, timings = await asyncio.get_running_loop().run_in_executor(
+                        pool, convert_page, breadcrumbs, filename.name, content, pdf, images
+                    )
+                markdown = markdown.encode("utf-8")
+                self.metrics.count("convert.pages")
+                for name, samples in timings.items():
+                    for seconds in samples:
+                        self.metrics.observe(name, seconds)
+                self.metrics.count("convert.tables", len(timings["convert.render_table"]))
+        except UnseenLinkError as e:
+            # The crawl has finished by now, so the link map is complete - a link that still can't be resolved
+            # points at something outside the ToC.
+            logging.error(f"Couldn't figure out the link {e} while processing {filename.name}")
+            self.metrics.count("convert.unresolved_links")
+            return
 
-        if filename in self.seen:
+        output_digest = digest(markdown)
+        # Checked against the file itself rather than the manifest, as it may have been changed by hand since
+        if self.force or not await self.holds(output, output_digest):
+            await self.write(output, markdown)
+        self.search.record(key, record)
+        self.manifest.record(key, **inputs, links=links, images=images, output=output_digest)
+
+    def cache_key(self, url: httpx.URL) -> str:
+        key = url.path.replace(self.base_uri, '')
+        if not key or key.endswith('/'):
+            key += 'index.html'
+        return key
+
+    async def fetch(self, url: httpx.URL, from_baseline: bool = False) -> str | None:
+        """
+        Make sure `url` is in the cache, without reading it back, and return its cache key. With `from_baseline`, a
+        copy in the baseline edition's cache is taken to be the same file.
+        """
+        key = self.cache_key(url)
+
+        if PurePosixPath(key).is_absolute() or '..' in PurePosixPath(key).parts:
+            raise PermissionError("Paths outside the manual are not allowed")
+
+        if key in self.cache:
+            self.metrics.count("cache.hits")
+            return key
+        self.metrics.count("cache.misses")
+        # The frontier of a crawl interrupted with `--baseline` can still hold baseline items when resumed without it
+        if from_baseline and self.baseline and key in self.baseline.cache:
+            await self.cache.take(key, self.baseline.cache)
+            self.metrics.count("baseline.assets")
+            return key
+        if self.offline:
+            logging.warning(f"Not in cache: {url}")
+            return None
+
+        logging.info(f"Downloading: {url}")
+        try:
+            response = await self.fetcher.get(url, self.metrics)
+        except httpx.HTTPError as e:
+            logging.error(f"Giving up on {url}: {e!r}")
+            self.metrics.count("fetch.failed")
+            return None
+        self.metrics.count("fetch.bytes", len(response.content))
+        logging.debug(f"Caching: {url}")
+        await self.cache.put(key, response.content)
+        return key
+
+    async def download(self, url: httpx.URL) -> (PurePosixPath, bytes):
+        key = await self.fetch(url)
+        if key is None:
             return None, None
-
-        self.seen.add(filename)
-
-        if filename.is_absolute():
-            raise PermissionError("Absolute paths are not allowed")
-
-        if filename.exists():
-            async with aiofiles.open(filename, "rb") as f:
-                logging.debug(f"Reading cached: {filename}")
-                content = await f.read()
-        else:
-            logging.info(f"Downloading: {url}")
-            response = await self.session.get(url)
-            await aiofiles.os.makedirs(os.path.dirname(filename), exist_ok=True)
-            async with aiofiles.open(filename, "wb") as f:
-                logging.debug(f"Caching: {url}")
-                await f.write(response.content)
-            content = response.content
-
-        return filename, content
-
-    async def parse_page(self, url: httpx.URL, breadcrumbs: list[str]):
+        logging.debug(f"Reading cached: {key}")
+        return PurePosixPath(key), await self.cache.get(key)
+
+    async def store_asset(self, breadcrumbs: list[str], key: str):
+        # PDFs need no conversion, so they go straight from the cache into `docs/` while crawling, without ever being
+        # held in memory whole
+        output = self.register(breadcrumbs, PurePosixPath(key))
+        docs_key = self.docs_key(output)
+        source = await self.cache.digest(key)
+        if output.exists() and not self.force and self.manifest.matches(docs_key, source=source):
+            self.metrics.count("write.fresh")
+            return
+        logging.info(f"Writing docs: {output}")
+        with self.metrics.time("write"):
+            await self.cache.export(key, output)
+        self.metrics.count("write.files")
+        self.manifest.record(docs_key, source=source)
+
+    async def enqueue(self, kind: str, url: httpx.URL, breadcrumbs: list[str] | None = None):
+        key = self.cache_key(url)
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        self.checkpoint.enqueued(key, kind, str(url), breadcrumbs or [])
+        self.frontier.put(kind, (str(url), breadcrumbs or []))
+
+    async def fetch_asset(self, url: httpx.URL, breadcrumbs: list[str], from_baseline: bool = False) -> bool:
+        key = await self.fetch(url, from_baseline)
+        if key is None:
+            return False
+        # Images are deduplicated and encoded once the crawl is over, see `convert`
+        if not key.endswith(".png"):
+            await self.store_asset(breadcrumbs, key)
+        return True
+
+    async def fetch_page(self, url: httpx.URL) -> bool:
         filename, page_content = await self.download(url)
 
         if page_content is None:
-            return
+            return False
 
-        soup = BeautifulSoup(page_content, "html.parser")
+        with self.metrics.time("crawl.parse"):
+            soup = parse_html(page_content, self.parser, parse_only=DISCOVERY_TAGS)
 
+        # Images and PDFs named by a page that is byte for byte the same as in the baseline edition are taken to be
+        # the same files as well, and copied over from there instead of downloaded
+        asset = "asset"
+        if self.baseline and await self.baseline.unchanged(str(filename), page_content):
+            asset = "baseline-asset"
+
+        # Breadcrumbs aren't known until the crawl is over (see `walk`), but images only use them for their
+        # `article_map` entry, which nothing links to
+        page = CrawledPage()
         for item in soup.find_all("img"):
-            img_filename, img_content = await self.download(url_replace_leaf(url, item.attrs["src"]))
-            if img_filename is not None and img_content is not None:
-                await self.md_queue.put(self.markdownify(breadcrumbs, img_filename, img_content))
+            image = url_replace_leaf(url, item.attrs["src"])
+            page.images.append(self.cache_key(image))
+            await self.enqueue(asset, image)
 
         for item in soup.find_all("a", href=True, limit=200):
             if item.attrs["href"] == "javascript:Open()":
                 for line in soup.script.text.splitlines():
                     line = line.strip()
                     if match := re.match(r"var pdfname\s+=\s+'(.*?)'", line):
-                        pdf_filename, pdf_content = await self.download(url_replace_leaf(url, f"../pdf/{match.group(1)}"))
-                        if pdf_filename is not None and pdf_content is not None:
-                            await self.md_queue.put(self.markdownify(["pdf"], pdf_filename, pdf_content))
+                        page.pdf = PurePath(match.group(1)).name
+                        await self.enqueue(asset, url_replace_leaf(url, f"../pdf/{match.group(1)}"), ["pdf"])
                         break
             if "target" in item.attrs:
                 if item.attrs["target"] in ("main", "fraToc"):
-                    await self.parse_page(
-                        url_replace_leaf(url, item.attrs["href"]),
-                        breadcrumbs + [item.text]
-                    )
-
-        await self.md_queue.put(self.markdownify(breadcrumbs, filename.with_suffix('.md'), page_content))
+                    child = url_replace_leaf(url, item.attrs["href"])
+                    page.children.append((str(child), item.text))
+                    await self.enqueue("page", child)
+
+        self.crawled[str(filename)] = page
+        self.checkpoint.crawled(str(filename), page.children, page.pdf, page.images)
+        return True
+
+    def walk(self, url: httpx.URL, breadcrumbs: list[str], visited: set[str]):
+        # Depth-first over the crawled ToC, in document order. The first path that reaches a page decides its
+        # breadcrumbs, no matter in which order the concurrent crawl happened to fetch things.
+        key = self.cache_key(url)
+        if key in visited or key not in self.crawled:
+            return
+        visited.add(key)
+
+        page = self.crawled[key]
+        for child, text in page.children:
+            self.walk(httpx.URL(child), breadcrumbs + [text], visited)
+
+        if page.pdf:
+            # Normally done by `store_asset`, but that doesn't run again for PDFs fetched before a resumed crawl
+            self.register(["pdf"], PurePosixPath(page.pdf))
+        for image in page.images:
+            name = PurePosixPath(image)
+            self.register([], name)
+            self.image_keys.setdefault(name.name, image)
+        filename = PurePosixPath(key).with_suffix('.md')
+        self.pages.append((breadcrumbs, key, self.register(breadcrumbs, filename), page.pdf))
 
     async def worker(self):
-        while not self.md_queue.empty():
-            task = await self.md_queue.get()
-            await task
+        while True:
+            kind, (url, breadcrumbs) = await self.frontier.get()
+            try:
+                if kind == "page":
+                    done = await self.fetch_page(httpx.URL(url))
+                else:
+                    done = await self.fetch_asset(httpx.URL(url), breadcrumbs, from_baseline=kind == "baseline-asset")
 
-    async def scrape(self):
-        response = await self.session.get(self.start_url)
-        index = BeautifulSoup(response.text, "html.parser")
+                if done:
+                    self.checkpoint.completed(url)
+                else:
+                    # Leave it on the persisted frontier so a resumed crawl tries again, and let a later link to the
+                    # same file try again in this one
+                    self.seen.discard(self.cache_key(httpx.URL(url)))
+                if self.checkpoint.due():
+                    # Whatever the checkpoint records as done has to be in the cache first
+                    self.cache.flush()
+                    self.checkpoint.flush()
+            finally:
+                self.frontier.task_done()
+
+            # The HTTP client can swallow a cancellation that arrives mid-request and return the response anyway, so
+            # make sure a cancelled worker doesn't go on to the next item
+            if asyncio.current_task().cancelling():
+                raise asyncio.CancelledError()
+
+    async def crawl(self):
+        """First phase: walk the whole ToC, building `article_map` and `nav` without converting anything."""
+        if roots := self.checkpoint.get_state("roots"):
+            self.model = self.checkpoint.get_state("model")
+            self.seen = self.checkpoint.seen()
+            self.crawled = {path: CrawledPage(children, pdf, images)
+                            for path, (children, pdf, images) in self.checkpoint.pages().items()}
+            pending = self.checkpoint.frontier()
+            logging.info(f"Resuming crawl: {len(self.crawled)} pages crawled, {len(pending)} items left")
+            for kind, url, breadcrumbs in pending:
+                self.frontier.put(kind, (url, breadcrumbs))
+        else:
+            roots = await self.crawl_menus()
+
+        # Every page, image and PDF is a separate item on the frontier, so the fetcher can keep as many requests in
+        # flight as the server allows, however deep the ToC is
+        try:
+            async with TaskGroup() as group:
+                workers = [group.create_task(self.worker()) for _ in range(self.fetcher.max_concurrency)]
+                await self.frontier.join()
+                for worker in workers:
+                    worker.cancel()
+        finally:
+            self.cache.flush()
+            self.checkpoint.flush()
+
+        visited = set()
+        for url, breadcrumbs in roots:
+            self.walk(httpx.URL(url), breadcrumbs, visited)
+
+    async def crawl_menus(self) -> list[tuple[str, list[str]]]:
+        # The frames go through `download()` as well, so that they are cached for offline rebuilds
+        _, content = await self.download(httpx.URL(self.start_url))
+        if content is None:
+            raise FileNotFoundError(f"No cached index for {self.wsm_id}, run an online scrape first")
+        index = parse_html(content, self.parser)
 
         main_menu_src = index.find("frame", attrs={"name": "main_menu"}).attrs["src"]
-        response = await self.session.get(self.start_url + main_menu_src)
-        main_menu_soup = BeautifulSoup(response.text, "html.parser")
-        model = main_menu_soup.find("font", color="#ffffff").text
+        _, content = await self.download(httpx.URL(self.start_url + main_menu_src))
+        main_menu_soup = parse_html(content, self.parser)
+        self.model = main_menu_soup.find("font", color="#ffffff").text
 
         srvc_menu_src = index.find("frame", attrs={"name": "srvc_menu"}).attrs["src"]
-        response = await self.session.get(self.start_url + srvc_menu_src)
-        srvc_menu_soup = BeautifulSoup(response.text, "html.parser")
+        srvc_menu_url = httpx.URL(self.start_url + srvc_menu_src)
+        _, content = await self.download(srvc_menu_url)
+        srvc_menu_soup = parse_html(content, self.parser)
 
         left_menu_list = []
         default_file_list = []
@@ -262,13 +670,149 @@ class WSMScraper:
             elif match := re.match(r'^DefaultFileList\[\d+]\s+=\s+"(.*?)";$', line):
                 default_file_list.append(match.group(1))
 
+        roots = []
         for title, src in zip(srvc_menu_soup.find_all("option"), left_menu_list):
-            await self.md_queue.put(self.parse_page(url_replace_leaf(response.url, src), [title.text]))
-
-        async with TaskGroup() as group:
-            for i in range(CONCURRENCY):
-                group.create_task(self.worker())
-
+            url = url_replace_leaf(srvc_menu_url, src)
+            roots.append((str(url), [title.text]))
+            await self.enqueue("page", url)
+
+        self.checkpoint.set_state("model", self.model)
+        self.checkpoint.set_state("roots", roots)
+        return roots
+
+    async def process_image(self, pool: ProcessPoolExecutor, source: str, names: list[str]):
+        # Every copy of the image is shown from the file of the first one
+        key = self.image_keys[names[0]]
+        output = self.output_path.joinpath("docs", "images", image_file(names[0], self.image_format))
+        docs_key = self.docs_key(output)
+        inputs = dict(source=source, encoder=self.encoder_version)
+
+        if not self.force and output.exists() and self.manifest.matches(docs_key, **inputs):
+            entry = self.manifest.get(docs_key)
+            self.metrics.count("image.fresh")
+        elif self.baseline and not self.force and (reused := await self.baseline.image(docs_key, **inputs)):
+            path, entry = reused
+            await link_or_copy(path, output)
+            self.manifest.record(docs_key, **entry)
+            self.metrics.count("baseline.images")
+        else:
+            content = await self.cache.get(key)
+            try:
+                with self.metrics.time("image"):
+                    encoded, width, height = await asyncio.get_running_loop().run_in_executor(
+                        pool, encode_image, content, self.image_format
+                    )
+            except OSError as e:
+                # Left out of `images`, so pages show the originals, from where they always were
+                logging.error(f"Couldn't read the image {names[0]}: {e}")
+                self.metrics.count("image.failed")
+                for name in names:
+                    await self.cache.export(self.image_keys[name], output.with_name(name))
+                return
+            if encoded == content:
+                # Kept as it was, so linked from the cache like PDFs are rather than stored once more
+                await self.cache.export(key, output)
+            else:
+                await self.write(output, encoded)
+            entry = dict(inputs, width=width, height=height, output=digest(encoded))
+            self.manifest.record(docs_key, **entry)
+            self.metrics.count("image.encoded")
+            self.metrics.count("image.bytes_in", len(content))
+            self.metrics.count("image.bytes_out", len(encoded))
+
+        image = Image(output.name, entry["width"], entry["height"])
+        for name in names:
+            self.images[name] = image
+            self.image_refs[name] = image.ref
+        self.metrics.count("image.duplicates", len(names) - 1)
+
+    def page_images(self, source_key: str) -> set[str]:
+        return {PurePosixPath(key).name for key in self.crawled[source_key].images}
+
+    async def image_groups(self) -> dict[str, list[str]]:
+        """Images that aren't encoded yet by their content, as each is encoded once however many names it goes by."""
+        groups: dict[str, list[str]] = {}
+        for name, key in sorted(self.image_keys.items()):
+            if name not in self.images and key in self.cache:
+                groups.setdefault(await self.cache.digest(key), []).append(name)
+        return groups
+
+    async def builder(self, pool: ProcessPoolExecutor, work: Scheduler):
+        while True:
+            lane, item = await work.get()
+            try:
+                if lane == "image":
+                    source, names = item
+                    await self.process_image(pool, source, names)
+                    for name in names:
+                        work.resolve(name)
+                else:
+                    await self.markdownify(pool, *item)
+            finally:
+                work.task_done()
+
+    async def convert(self, pages: list[tuple[list[str], str, Path, str | None]],
+                      images: dict[str, list[str]] | None = None):
+        """
+        Encode `images`, grouped as `image_groups` returns them, and convert `pages` whose outputs are out of date,
+        in one fresh pool so it runs the current conversion rules. Images go first, and a page gets in line as soon as
+        the images it shows are done rather than after all of them, so no worker waits on a stage boundary.
+        """
+        images = images or {}
+        work = self.work = Scheduler(BUILD_LANES)
+        for item in images.items():
+            work.put("image", item)
+        pending = {name for names in images.values() for name in names}
+        # Pages are only read from the cache once a builder picks them up, so however many are in line, no more than
+        # one per builder is held in memory at a time
+        for page in pages:
+            work.put("convert", page, after=self.page_images(page[1]) & pending)
+
+        workers = max(1, min(self.convert_workers, len(pages) + len(images)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_converter,
+                                 initargs=(LinkIndex(self.article_map), self.nav, self.parser)) as pool:
+            try:
+                async with TaskGroup() as group:
+                    builders = [group.create_task(self.builder(pool, work)) for _ in range(workers * 2)]
+                    await work.join()
+                    for builder in builders:
+                        builder.cancel()
+            finally:
+                self.manifest.save()
+
+    def write_search_index(self):
+        # Only the pages converted again have new records, the site's index is put together from all of them
+        self.search.retain({self.docs_key(output) for _, _, output, _ in self.pages})
+        self.search.write_site_index(self.output_path.joinpath("docs", "search"))
+        self.search.save()
+
+    async def build(self):
+        """Second phase: convert every crawled page exactly once, against the complete link map."""
+        with self.metrics.time("stage.convert"):
+            await self.convert(self.pages, await self.image_groups())
+
+        with self.metrics.time("stage.search"):
+            self.write_search_index()
+
+        with self.metrics.time("stage.mkdocs"):
+            self.write_mkdocs()
+
+        if self.baseline:
+            self.report_changes()
+
+    def report_changes(self):
+        sources = {}
+        for _, _, output, _ in self.pages:
+            key = self.docs_key(output)
+            sources[key] = (self.manifest.get(key) or {}).get("source")
+        report = self.baseline.changes(sources)
+        save_report(self.output_path.joinpath("changes.json"), report)
+        logging.info(f"Changes since {self.baseline.wsm_id}: {len(report['added'])} pages added, "
+                     f"{len(report['modified'])} modified, {len(report['moved'])} moved, "
+                     f"{len(report['removed'])} removed, {report['unchanged']} unchanged")
+
+    def write_mkdocs(self):
+        hook = Path(__file__).with_name("mkdocs_search_hook.py")
         mkdocs = {
             "markdown_extensions": [
                 "sane_lists",
@@ -276,8 +820,10 @@ class WSMScraper:
                 "def_list",
                 "grids"
             ],
-            "site_name": f"Mazda WSM // {model} ({self.wsm_id})",
-            "nav": listify_dict(self.nav),
+            # The full index is built incrementally by the scraper, see `mkdocs_search_hook.py`
+            "plugins": [{"search": {"indexing": "titles"}}],
+            "hooks": ["mkdocs_search_hook.py"],
+            "site_name": f"Mazda WSM // {self.model} ({self.wsm_id})",
             "theme": {
                 "name": "terminal",
                 "features": [
@@ -285,9 +831,123 @@ class WSMScraper:
                 ]
             }
         }
-        with open(self.output_path.joinpath("mkdocs.yml"), "w") as outfile:
-            yaml.dump(mkdocs, outfile)
+        # Nothing to do unless the nav, the rest of the config or the hook changed. `json` is quick enough to tell.
+        output = self.output_path.joinpath("mkdocs.yml")
+        source = digest(json.dumps([mkdocs, self.nav, sorted(CAPITALIZED)]) + hook.read_text() + "".join(
+            inspect.getsource(function) for function in (nav_title, yaml_events, nav_events, mkdocs_events)
+        ))
+        if not self.force and output.exists() and self.manifest.matches("mkdocs.yml", source=source):
+            self.metrics.count("write.fresh")
+            return
+
+        atomic_write(output, yaml.emit(mkdocs_events(mkdocs, self.nav), Dumper=YAML_DUMPER))
+        with atomic_path(self.output_path.joinpath(hook.name)) as partial:
+            shutil.copyfile(hook, partial)
+        self.manifest.record("mkdocs.yml", source=source)
+        self.manifest.save()
+
+    def status(self) -> str:
+        counters = self.metrics.counters
+        converted = counters["convert.pages"] + counters["convert.fresh"] + counters["convert.unresolved_links"]
+        return (f"{len(self.crawled)} pages crawled, {self.frontier.qsize()} queued, "
+                f"{self.fetcher.limiter.in_flight}/{int(self.fetcher.limiter.limit)} requests in flight, "
+                f"{counters['fetch.bytes'] / 2 ** 20:.1f} MiB downloaded | "
+                f"{converted}/{len(self.pages)} pages converted")
+
+    async def monitor(self, interval: float = 1.0):
+        """Samples queue depths and the fetcher's concurrency over time, and keeps the progress line up to date."""
+        while True:
+            for scheduler in (self.frontier, self.work):
+                for lane in scheduler.lanes if scheduler else ():
+                    self.metrics.sample(f"queue.{lane}", scheduler.qsize(lane))
+            self.metrics.sample("fetch.in_flight", self.fetcher.limiter.in_flight)
+            self.metrics.sample("fetch.limit", int(self.fetcher.limiter.limit))
+            if self.progress:
+                self.progress.update(self.status())
+            await asyncio.sleep(interval)
+
+    async def scrape(self):
+        monitor = asyncio.create_task(self.monitor())
+        try:
+            with self.metrics.time("stage.crawl"):
+                await self.crawl()
+            with self.metrics.time("stage.build"):
+                await self.build()
+        finally:
+            monitor.cancel()
+            if self.progress:
+                self.progress.update(self.status())
+                self.progress.close()
+            self.cache.close()
+            # Whatever a failed run got done stays in the checkpoint for the next one
+            self.checkpoint.close()
+            if self.baseline:
+                self.baseline.cache.close()
+            if self.owns_fetcher:
+                await self.fetcher.aclose()
+            self.metrics.save(self.output_path.joinpath("profile.json"))
+        logging.info(f"Finished in {self.metrics.summary()['elapsed_s']}s, "
+                     f"profile written to {self.output_path.joinpath('profile.json')}")
+        # Only an interrupted run has anything to resume
+        self.checkpoint.remove()
 
 if __name__ == "__main__":
-    scraper = WSMScraper()
-    asyncio.run(scraper.scrape())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download a Mazda Workshop Manual and convert it into a MkDocs site")
+    parser.add_argument("--cache", default="wsm", help="directory holding the download cache and generated sites")
+    parser.add_argument("--wsm-id", nargs="+", default=["D933-1A-22C_Ver26"],
+                        help="manuals to scrape; several are crawled concurrently over one connection pool")
+    parser.add_argument("--shared-assets", action="store_true",
+                        help="store images and PDFs once by content hash under <cache>/assets, shared by every "
+                             "manual (always on with more than one --wsm-id)")
+    parser.add_argument("--site", default=SITE, help="where the manuals are served from")
+    parser.add_argument("--baseline", metavar="WSM_ID",
+                        help="an already built edition of the same manual: unchanged pages and their images and PDFs "
+                             "are taken from it instead of fetched and converted again, and changes.json lists what "
+                             "changed")
+    parser.add_argument("--offline", action="store_true",
+                        help="rebuild docs/ and mkdocs.yml from the cache only, without touching the network")
+    parser.add_argument("--force", action="store_true", default=bool(os.environ.get("FORCE_MARKDOWN", False)),
+                        help="regenerate pages that already exist (also set by FORCE_MARKDOWN)")
+    parser.add_argument("--images", default="png", choices=IMAGE_FORMATS,
+                        help="recompress images losslessly as PNG, convert them to lossless WebP or copy them as they "
+                             "are; duplicates are written once either way")
+    parser.add_argument("--parser", default=HTML_PARSER, choices=["html.parser", "lxml"],
+                        help="BeautifulSoup tree builder; lxml is faster but has to be installed separately")
+    parser.add_argument("--store", default="loose", choices=["loose", "packed"],
+                        help="keep the download cache as loose files, or packed into a single SQLite database")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="requests in flight to start with")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="upper bound for the adaptive number of requests in flight")
+    parser.add_argument("--rate", type=float, help="maximum requests per second to each host")
+    parser.add_argument("--retries", type=int, default=3, help="retries for failed, throttled or timed out requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds before a request is abandoned")
+    parser.add_argument("--http2", action="store_true", help="use HTTP/2 (needs httpx[http2])")
+    parser.add_argument("--progress", action="store_true",
+                        help="show a live progress line while scraping (one manual at a time only)")
+    args = parser.parse_args()
+
+    async def main() -> bool:
+        editions = len(args.wsm_id)
+        assets = AssetStore(Path(args.cache, "assets")) if args.shared_assets or editions > 1 else None
+        try:
+            async with Fetcher(args.concurrency, args.max_concurrency, rate=args.rate, retries=args.retries,
+                               timeout=args.timeout, http2=args.http2) as fetcher:
+                # Every manual builds in its own process pool, so they share the CPUs between them
+                scrapers = [WSMScraper(args.cache, wsm_id, convert_workers=max(1, CONVERT_WORKERS // editions),
+                                       site=args.site, offline=args.offline, force=args.force, parser=args.parser,
+                                       fetcher=fetcher,
+                                       cache=args.store, progress=args.progress and editions == 1, assets=assets,
+                                       baseline=args.baseline, image_format=args.images)
+                            for wsm_id in args.wsm_id]
+                results = await asyncio.gather(*(scraper.scrape() for scraper in scrapers), return_exceptions=True)
+        finally:
+            if assets:
+                assets.close()
+
+        # One manual failing shouldn't take the others down with it
+        for wsm_id, result in zip(args.wsm_id, results):
+            if isinstance(result, BaseException):
+                logging.error(f"Scraping {wsm_id} failed", exc_info=result)
+        return not any(isinstance(result, BaseException) for result in results)
+
+    sys.exit(0 if asyncio.run(main()) else 1)
@@ -0,0 +1,54 @@
+import hashlib
+import json
+from pathlib import Path
+
+from atomic import atomic_write
+
+MANIFEST_VERSION = 1
+
+
+def digest(content: bytes | str) -> str:
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+class BuildManifest:
+    """
+    Records, for every file written under `docs/`, hashes of the inputs it was generated from. A later run can then
+    compare them against its own inputs and only rewrite the outputs that actually changed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+
+        if path.exists():
+            data = json.loads(path.read_text())
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data["outputs"]
+
+    def get(self, key: str) -> dict | None:
+        return self.entries.get(key)
+
+    def matches(self, key: str, **inputs) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and all(entry.get(name) == value for name, value in inputs.items())
+
+    def fresh(self, key: str, article_map: dict[str, str], images: dict[str, str] | None = None, **inputs) -> bool:
+        """
+        Whether `key` was generated from these inputs, every link it resolved still points the same way and every image
+        it shows still has the same file and size.
+        """
+        if not self.matches(key, **inputs):
+            return False
+        entry = self.entries[key]
+        return all(article_map.get(href) == location for href, location in entry.get("links", {}).items()) and all(
+            (images or {}).get(name) == ref for name, ref in entry.get("images", {}).items()
+        )
+
+    def record(self, key: str, **inputs):
+        self.entries[key] = inputs
+
+    def save(self):
+        atomic_write(self.path, json.dumps({"version": MANIFEST_VERSION, "outputs": self.entries}, sort_keys=True))
@@ -1,11 +1,11 @@
+import time
 from dataclasses import dataclass
-from io import StringIO
 
 from bs4.element import NavigableString, Tag
 from markdownify import MarkdownConverter
 
 
-@dataclass
+@dataclass(slots=True)
 class Cell:
     colspan: int
     rowspan: int
@@ -33,42 +33,43 @@ class Cell:
 class Grid:
     def __init__(self):
         self._cells: list[list[Cell]] = [[]]
+        self._col_count = 0
 
     @property
     def empty(self):
-        return len(self._cells) == 0 or len(self._cells[0]) == 0
+        return len(self._cells) == 0 or self._col_count == 0
 
     @property
     def col_count(self):
-        return len(self._cells[0])
+        return self._col_count
 
     @property
     def row_count(self):
         return len(self._cells)
 
-    def _add_column(self) -> None:
-        for row in self._cells:
-            row.append(Cell.blank())
-
-    def _add_row(self) -> None:
-        self._cells.append([Cell.blank() for _ in range(self.col_count)])
+    @property
+    def rows(self) -> list[list[Cell]]:
+        return self._cells
+
+    def _grow(self, row: int, col: int) -> None:
+        # Add every missing row and column in one go rather than one at a time
+        if col >= self._col_count:
+            extra = col + 1 - self._col_count
+            for cells in self._cells:
+                cells.extend([Cell.blank() for _ in range(extra)])
+            self._col_count = col + 1
+        if row >= len(self._cells):
+            self._cells.extend([[Cell.blank() for _ in range(self._col_count)]
+                                for _ in range(row + 1 - len(self._cells))])
 
     def cell(self, row: int, col: int) -> Cell:
-        while row >= self.row_count:
-            self._add_row()
-
-        while col >= self.col_count:
-            self._add_column()
-
+        if row >= len(self._cells) or col >= self._col_count:
+            self._grow(row, col)
         return self._cells[row][col]
 
     def set(self, row: int, col: int, cell: Cell) -> None:
-        while row >= self.row_count:
-            self._add_row()
-
-        while col >= self.col_count:
-            self._add_column()
-
+        if row >= len(self._cells) or col >= self._col_count:
+            self._grow(row, col)
         self._cells[row][col] = cell
 
 class TableConverter(MarkdownConverter):
@@ -78,6 +79,8 @@ class TableConverter(MarkdownConverter):
         self._current_col: int = 0
         self._current_table: Grid = Grid()
         self._inline_id_attributes = False
+        # How long rendering each table took, for profiling
+        self.table_timings: list[float] = []
 
     def convert_table(self, el, text, parent_tags):
         if 'table' in parent_tags or not self._current_table.col_count:
@@ -89,66 +92,53 @@ class TableConverter(MarkdownConverter):
 
             raise NotImplementedError("Nested tables are not supported")
 
-        column_sizes = []
-        for col in range(self._current_table.col_count):
-            max_col_size = 0
-            for row in range(self._current_table.row_count):
-                if self._current_table.cell(row, col).size > max_col_size:
-                    max_col_size = self._current_table.cell(row, col).size
-            column_sizes.append(max_col_size)
-
-        result = StringIO()
-        for row in range(self._current_table.row_count):
-            data_line = ''
-            top_border = ''
-            bottom_border = ''
-
-            for col in range(self._current_table.col_count):
-                cell = self._current_table.cell(row, col)
-
-                if self._current_table.cell(row, col).rowspan > 1:
+        start = time.perf_counter()
+        rows = self._current_table.rows
+        column_sizes = [max(cell.size for cell in column) for column in zip(*rows)]
+
+        # Each line is built as a list of pieces and joined once. The bottom border only ever needs its last
+        # character looked at, so that is tracked separately instead of indexing into the line.
+        lines = [''.join('-' * (size + 1) if cell.spans_left else '+' + '-' * size
+                         for cell, size in zip(rows[0], column_sizes)) + '+']
+        last_row = len(rows) - 1
+        for row, cells in enumerate(rows):
+            data_line = []
+            bottom_border = []
+            bottom_end = ''
+            below = rows[row + 1] if row < last_row else None
+
+            for col, cell in enumerate(cells):
+                size = column_sizes[col]
+
+                if cell.rowspan > 1:
                     border_line_char = ' '
-
-                    if len(bottom_border) > 0 and bottom_border[-1] == '-':
-                        border_limit_left = '+'
-                    else:
-                        border_limit_left = '|'
+                    border_limit_left = '+' if bottom_end == '-' else '|'
                 else:
                     border_line_char = '-'
                     border_limit_left = '+'
 
-                if not cell.spans_left:
-                    data_line     += '|' + cell.text.ljust(column_sizes[col])
-                    top_border    += '+' + '-' * column_sizes[col]
-
-                    bottom_border += border_limit_left + border_line_char * column_sizes[col]
+                if not cell.spans_left or (below is not None and not below[col].spans_left):
+                    bottom_border.append(border_limit_left + border_line_char * size)
+                    bottom_end = border_line_char if size else border_limit_left
                 else:
-                    data_line   += ' ' * (column_sizes[col] + 1)
-                    top_border  += '-' * (column_sizes[col] + 1)
+                    bottom_border.append(border_line_char * (size + 1))
+                    bottom_end = border_line_char
 
-                    if row < self._current_table.row_count - 1 and not self._current_table.cell(row + 1, col).spans_left:
-                        bottom_border += border_limit_left + border_line_char * column_sizes[col]
-                    else:
-                        bottom_border += border_line_char * (column_sizes[col] + 1)
+                data_line.append(' ' * (size + 1) if cell.spans_left else '|' + cell.text.ljust(size))
 
-            data_line     += '|'
-            top_border    += '+'
+            data_line.append('|')
+            bottom_border.append('+' if bottom_end == '-' else '|')
+            bottom_border = ''.join(bottom_border)
 
-            if bottom_border[-1] == '-':
-                bottom_border += '+'
-            else:
-                bottom_border += '|'
-
-            if row == 0:
-                print(top_border, file=result)
-                if self._current_table.row_count > 1:
-                    bottom_border = bottom_border.replace('-', '=')
-            print(data_line, file=result)
-            print(bottom_border, file=result)
+            if row == 0 and last_row > 0:
+                bottom_border = bottom_border.replace('-', '=')
+            lines.append(''.join(data_line))
+            lines.append(bottom_border)
 
         self._reset_table()
+        self.table_timings.append(time.perf_counter() - start)
 
-        return '\n\n' + result.getvalue()
+        return '\n\n' + '\n'.join(lines) + '\n'
 
     def _convert_cell(self, el, text):
         colspan = rowspan = 1
@@ -158,19 +148,27 @@ class TableConverter(MarkdownConverter):
             rowspan = int(el['rowspan'])
         text = ' ' + text.strip().replace('\n', ' ') + ' '
 
-        while self._current_table.cell(self._current_row, self._current_col).spans_up:
+        table = self._current_table
+        while table.cell(self._current_row, self._current_col).spans_up:
             self._current_col += 1
 
-        self._current_table.set(self._current_row, self._current_col, Cell(colspan, rowspan, len(text), text))
-
-        for col in range(colspan):
-            for row in range(rowspan):
+        table.set(self._current_row, self._current_col, Cell(colspan, rowspan, len(text), text))
+
+        # Grow the grid to cover the whole span once, then walk its rows directly. A zero span covers no cells at all.
+        if not colspan or not rowspan:
+            self._current_col += colspan
+            return text
+        table.cell(self._current_row + rowspan - 1, self._current_col + colspan - 1)
+        for row in range(rowspan):
+            cells = table.rows[self._current_row + row]
+            for col in range(colspan):
+                cell = cells[self._current_col + col]
                 if col > 0:
-                    self._current_table.cell(self._current_row + row, self._current_col + col).spans_left = True
+                    cell.spans_left = True
                 if row > 0:
-                    self._current_table.cell(self._current_row + row, self._current_col + col).spans_up = True
-                self._current_table.cell(self._current_row + row, self._current_col + col).colspan = colspan - col
-                self._current_table.cell(self._current_row + row, self._current_col + col).rowspan = rowspan - row
+                    cell.spans_up = True
+                cell.colspan = colspan - col
+                cell.rowspan = rowspan - row
 
         self._current_col += colspan
         return text
@@ -231,6 +229,6 @@ class TableConverter(MarkdownConverter):
         self._current_col = 0
         self._current_table = Grid()
 
-    def convert(self, html):
+    def convert_soup(self, soup):
         self._reset_table()
-        return super().convert(html)
+        return super().convert_soup(soup)
@@ -0,0 +1,108 @@
+import bisect
+import json
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from atomic import atomic_write
+
+# Upper bounds of the latency histogram buckets in seconds, from 0.1ms to about 105s, each 19% wider than the last
+BUCKETS = [0.0001 * 2 ** (i / 4) for i in range(81)]
+
+
+class Histogram:
+    """Latencies counted into fixed buckets, so that any number of observations takes the same space."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        # The upper bound of the bucket the percentile falls into, so at most 19% above the real value
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + [self.max], self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 3),
+            "mean_ms": round(1000 * self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(1000 * self.percentile(0.5), 2),
+            "p95_ms": round(1000 * self.percentile(0.95), 2),
+            "max_ms": round(1000 * self.max, 2),
+        }
+
+
+class Metrics:
+    """
+    Counters, latency histograms and gauges sampled over time for a single run, summarised as JSON at the end so runs
+    can be compared with each other.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counters: dict[str, int] = defaultdict(int)
+        self.histograms: dict[str, Histogram] = defaultdict(Histogram)
+        self.series: dict[str, list[tuple[float, float]]] = defaultdict(list)
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def observe(self, name: str, seconds: float):
+        self.histograms[name].observe(seconds)
+
+    @contextmanager
+    def time(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def sample(self, name: str, value: float):
+        self.series[name].append((round(time.monotonic() - self.started, 2), value))
+
+    def summary(self) -> dict:
+        return {
+            "elapsed_s": round(time.monotonic() - self.started, 3),
+            "counters": dict(sorted(self.counters.items())),
+            "latency": {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            "series": dict(sorted(self.series.items())),
+        }
+
+    def save(self, path: Path):
+        atomic_write(path, json.dumps(self.summary(), indent=1))
+
+
+class Progress:
+    """A single status line, rewritten in place on a terminal."""
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+        self.width = 0
+
+    def update(self, line: str):
+        self.stream.write("\r" + line.ljust(self.width))
+        self.stream.flush()
+        self.width = len(line)
+
+    def close(self):
+        if self.width:
+            self.stream.write("\n")
+            self.stream.flush()
+            self.width = 0
@@ -0,0 +1,13 @@
+"""
+MkDocs hook, copied next to every generated mkdocs.yml: the scraper already wrote the full search index into
+`docs/search/`, so the search plugin only indexes titles and its output is replaced with that index once the site is
+built.
+"""
+import shutil
+from pathlib import Path
+
+
+def on_post_build(config, **kwargs):
+    prebuilt = Path(config["docs_dir"], "search", "search_index.json")
+    if prebuilt.exists():
+        shutil.copyfile(prebuilt, Path(config["site_dir"], "search", "search_index.json"))
@@ -0,0 +1,51 @@
+import asyncio
+import itertools
+from collections import Counter, defaultdict
+
+
+class Scheduler:
+    """
+    Work items in priority lanes: a worker always gets the oldest item of the first lane that has any. Like
+    `asyncio.Queue`, `join()` only returns once every item put has been marked done, so as long as a worker puts the
+    work an item leads to before marking the item itself done, the job can't be taken for finished while any of it
+    is left.
+
+    Items can also wait for dependencies, and only go in their lane once the last of them is `resolve`d.
+    """
+
+    def __init__(self, lanes: list[str]):
+        self.lanes = {lane: priority for priority, lane in enumerate(lanes)}
+        self.queue = asyncio.PriorityQueue()
+        self.order = itertools.count()
+        self.sizes = Counter()
+        self.blocked: dict[object, list[list]] = defaultdict(list)
+
+    def put(self, lane: str, item, after: set = frozenset()):
+        if after:
+            entry = [len(after), lane, item]
+            for dependency in after:
+                self.blocked[dependency].append(entry)
+            return
+        self.queue.put_nowait((self.lanes[lane], next(self.order), lane, item))
+        self.sizes[lane] += 1
+
+    def resolve(self, dependency):
+        """Has to happen before the item that resolved `dependency` is marked done, or `join()` could return early."""
+        for entry in self.blocked.pop(dependency, []):
+            entry[0] -= 1
+            if not entry[0]:
+                self.put(entry[1], entry[2])
+
+    async def get(self) -> tuple[str, object]:
+        _, _, lane, item = await self.queue.get()
+        self.sizes[lane] -= 1
+        return lane, item
+
+    def task_done(self):
+        self.queue.task_done()
+
+    async def join(self):
+        await self.queue.join()
+
+    def qsize(self, lane: str | None = None) -> int:
+        return self.queue.qsize() if lane is None else self.sizes[lane]
@@ -0,0 +1,122 @@
+import json
+import re
+from pathlib import Path, PurePosixPath
+
+from bs4 import BeautifulSoup
+from bs4.element import NavigableString, Tag
+
+from atomic import atomic_write
+
+SEARCH_VERSION = 1
+# OBD-II style trouble codes (P0101, B1342, U0100) and Mazda part numbers (PE01-13-520, KD45-51-040A)
+CODE_PATTERN = re.compile(r"\b(?:[PBCU][0-9][0-9A-F]{3}|[0-9A-Z]{4}-[0-9A-Z]{2}-[0-9A-Z]{3}[0-9A-Z]?)\b")
+# What MkDocs' search plugin puts in its own index by default, except that words are only split at whitespace: lunr
+# tests the separator one character at a time, so splitting at hyphens as well would break every part number up into
+# pieces, in the index and in the query alike
+SEARCH_CONFIG = {"lang": ["en"], "separator": r"\s+", "pipeline": ["stopWordFilter"]}
+# Text in these never shows up on the page
+HIDDEN_TAGS = {"script", "style", "title", "head"}
+
+
+def search_record(soup: BeautifulSoup, breadcrumbs: list[str]) -> dict:
+    """
+    What the search index needs from a page, taken from its parse tree in one walk: the text without any of the
+    Markdown table syntax, split into the sections its `<a name>` anchors start, and the codes in it.
+    """
+    sections = [{"id": None, "text": []}]
+    for node in soup.descendants:
+        if isinstance(node, Tag):
+            if node.name == "a" and node.get("name") and not node.get("href"):
+                sections.append({"id": node["name"], "text": []})
+        elif type(node) is NavigableString and node.parent.name not in HIDDEN_TAGS:
+            if text := node.strip():
+                sections[-1]["text"].append(text)
+
+    for section in sections:
+        section["text"] = " ".join(" ".join(section["text"]).split())
+        section["title"] = section["text"][:80]
+    text = " ".join(section["text"] for section in sections if section["text"])
+    return {
+        "title": breadcrumbs[-1] if breadcrumbs else "",
+        "path": breadcrumbs,
+        "text": text,
+        "sections": [section for section in sections[1:] if section["text"]],
+        "codes": sorted(set(CODE_PATTERN.findall(text))),
+    }
+
+
+def location(key: str) -> str:
+    """The URL MkDocs serves `docs/<key>` at, with its default directory URLs."""
+    path = PurePosixPath(key)
+    if path.stem in ("index", "README"):
+        return "" if path.parent == PurePosixPath(".") else path.parent.as_posix() + "/"
+    return path.with_suffix("").as_posix() + "/"
+
+
+class SearchIndex:
+    """
+    Search records for every page under `docs/`, kept between runs next to the build manifest so that only pages
+    that were converted again need new ones. The site's index is put together from them without tokenising
+    anything.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.records: dict[str, dict] = {}
+        self.changed = False
+
+        if path.exists():
+            data = json.loads(path.read_text())
+            if data.get("version") == SEARCH_VERSION:
+                self.records = data["pages"]
+                # The records still hold, but the site's index has to be written again with the new settings
+                self.changed = data.get("config") != SEARCH_CONFIG
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.records
+
+    def get(self, key: str) -> dict | None:
+        return self.records.get(key)
+
+    def record(self, key: str, record: dict):
+        if self.records.get(key) != record:
+            self.records[key] = record
+            self.changed = True
+
+    def retain(self, keys: set[str]):
+        """Forget pages that are no longer part of the site."""
+        for key in self.records.keys() - keys:
+            del self.records[key]
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        atomic_write(self.path, json.dumps({"version": SEARCH_VERSION, "config": SEARCH_CONFIG, "pages": self.records},
+                                           sort_keys=True))
+        self.changed = False
+
+    def write_site_index(self, directory: Path):
+        """
+        Write `search_index.json` in the layout of MkDocs' search plugin, and `codes.json`, mapping every trouble
+        code and part number to the pages that mention it, for exact lookups. Goes before `save`, which marks the
+        records as unchanged again.
+        """
+        if not self.changed and directory.joinpath("search_index.json").exists():
+            return
+
+        docs = []
+        codes: dict[str, list[str]] = {}
+        for key, record in sorted(self.records.items()):
+            page = location(key)
+            docs.append({"location": page, "title": record["title"], "text": record["text"],
+                         "path": record["path"]})
+            for section in record["sections"]:
+                docs.append({"location": f"{page}#{section['id']}", "title": section["title"],
+                             "text": section["text"]})
+            for code in record["codes"]:
+                codes.setdefault(code, []).append(page)
+
+        for name, data in (("search_index.json", {"config": SEARCH_CONFIG, "docs": docs}),
+                           ("codes.json", dict(sorted(codes.items())))):
+            atomic_write(directory.joinpath(name), json.dumps(data))
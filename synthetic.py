@@ -0,0 +1,194 @@
+import argparse
+import functools
+import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+WORDS = (
+    "remove install inspect bolt nut bracket harness connector sensor valve pump hose clamp gasket seal cover "
+    "engine transmission brake caliper rotor pad fluid filter switch relay fuse module terminal voltage resistance"
+).split()
+
+
+def png(width: int, height: int, seed: int) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    rnd = random.Random(seed)
+    rows = b"".join(b"\x00" + bytes(rnd.randrange(4) * 60 for _ in range(width * 3)) for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 1)) + chunk(b"IEND", b""))
+
+
+def sentence(rnd: random.Random, words: int = 8) -> str:
+    return " ".join(rnd.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def table(rnd: random.Random, rows: int, cols: int) -> str:
+    html = ['<table border="1">',
+            "<tr>" + "".join(f"<th>{rnd.choice(WORDS).title()}</th>" for _ in range(cols)) + "</tr>"]
+    covered: set[tuple[int, int]] = set()
+    for row in range(1, rows):
+        cells = []
+        for col in range(cols):
+            if (row, col) in covered:
+                continue
+            rowspan = 2 if rnd.random() < 0.15 and row < rows - 1 else 1
+            colspan = 2 if rnd.random() < 0.1 and col < cols - 1 and (row, col + 1) not in covered else 1
+            for r in range(rowspan):
+                for c in range(colspan):
+                    covered.add((row + r, col + c))
+            attrs = (f' rowspan="{rowspan}"' if rowspan > 1 else "") + (f' colspan="{colspan}"' if colspan > 1 else "")
+            cells.append(f"<td{attrs}>{rnd.choice(['P0101', 'B1342', 'PE01-13-520', sentence(rnd, 2)])}</td>")
+        html.append("<tr>" + "".join(cells) + "</tr>")
+    html.append("</table>")
+    return "\n".join(html)
+
+
+class SyntheticManual:
+    """
+    A made-up Workshop Manual with the same frame structure as the real ones: `index.html` with the `main_menu` and
+    `srvc_menu` frames, a `srvc_menu` script listing `LeftMenuList`/`DefaultFileList`, ToCs nested `depth` levels
+    deep through `fraToc` links, and pages with row/colspan tables, images, anchors, cross-links and
+    `javascript:Open()` PDFs.
+    """
+
+    def __init__(self, sections: int = 3, depth: int = 1, fanout: int = 3, pages: int = 4, seed: int = 0):
+        self.sections = sections
+        self.depth = depth
+        self.fanout = fanout
+        self.pages = pages
+        self.rnd = random.Random(seed)
+        self.page_count = sections * fanout ** depth * pages
+        self._next_page = 0
+
+    def generate(self, root: Path, wsm_id: str = "SYNTH-01_Ver01") -> Path:
+        """Write the manual the way the site lays it out below `root`, and return the manual's own directory."""
+        base = root / "wsm-secure" / "WSM" / wsm_id
+        self.html = base / "esicont" / "srvc" / "html"
+        for kind in ("html", "png", "pdf"):
+            (base / "esicont" / "srvc" / kind).mkdir(parents=True, exist_ok=True)
+
+        (base / "index.html").write_text(
+            '<html><frameset><frame name="main_menu" src="main_menu.html">'
+            '<frame name="srvc_menu" src="esicont/srvc/html/srvc_menu.html"></frameset></html>')
+        (base / "main_menu.html").write_text('<html><body><font color="#ffffff">MAZDA SYNTH</font></body></html>')
+
+        options, menu_script = [], []
+        for section in range(self.sections):
+            options.append(f"<option>{self.rnd.choice(WORDS).title()} System {section}</option>")
+            menu_script.append(f'LeftMenuList[{section}] = "left_menu_{section:02d}.html";')
+            menu_script.append(f'DefaultFileList[{section}] = "id{self._next_page:012d}.html";')
+            self.write_toc(f"left_menu_{section:02d}", f"{section:02d}", self.depth)
+
+        (self.html / "srvc_menu.html").write_text(
+            "<html><body><select>" + "".join(options) + "</select><script>\n" + "\n".join(menu_script) +
+            "\n</script></body></html>")
+        return base
+
+    def write_toc(self, name: str, path: str, depth: int):
+        links = []
+        if depth:
+            for child in range(self.fanout):
+                child_path = f"{path}_{child:02d}"
+                links.append(f'<a href="node_{child_path}.html" target="fraToc">Node {child_path}</a><br>')
+                self.write_toc(f"node_{child_path}", child_path, depth - 1)
+        else:
+            for _ in range(self.pages):
+                page_id = self.write_page()
+                links.append(f'<a href="{page_id}.html" target="main">{sentence(self.rnd, 3)[:-1]}</a><br>')
+        (self.html / f"{name}.html").write_text("<html><body>" + "\n".join(links) + "</body></html>")
+
+    def write_page(self) -> str:
+        rnd = self.rnd
+        page_id = f"id{self._next_page:012d}"
+        pdf = self._next_page % self.pages == 0
+        self._next_page += 1
+
+        body = [f"<html><head><title>{page_id}</title>"]
+        if pdf:
+            body.append(f"<script>\nvar pdfname = '{page_id}.pdf';\n</script>")
+            (self.html.parent / "pdf" / f"{page_id}.pdf").write_bytes(
+                b"%PDF-1.4\n" + bytes(rnd.randrange(256) for _ in range(4096)))
+        body.append(f'</head><body><h1>{sentence(rnd, 4)}</h1><a name="top"></a>')
+        for section in range(3):
+            body.append(f'<a name="s{section}"></a><p><b>{sentence(rnd, 3)}</b></p><p>{sentence(rnd, 20)}</p>')
+            target = f"id{rnd.randrange(self.page_count):012d}"
+            body.append(f'<p>See <a href="{target}.html#s{rnd.randrange(3)}">{sentence(rnd, 3)}</a>.</p>')
+            body.append(table(rnd, rnd.randrange(3, 25), rnd.randrange(2, 6)))
+            image = f"img{page_id[2:]}{section}.png"
+            (self.html.parent / "png" / image).write_bytes(png(32 + section, 24, zlib.crc32(image.encode()) & 0xff))
+            body.append(f'<p><img src="../png/{image}"></p>')
+        if pdf:
+            body.append('<p><a href="javascript:Open()">Wiring diagram</a></p>')
+        body.append("</body></html>")
+        (self.html / f"{page_id}.html").write_text("\n".join(body))
+        return page_id
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    # Seconds to wait before answering each request, to stand in for a real server's round trip
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        super().do_GET()
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up early, e.g. an interrupted scrape, isn't worth a traceback
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+@contextmanager
+def serve(root: Path, latency: float = 0.0, port: int = 0, handler: type[QuietHandler] = QuietHandler):
+    """
+    Serve `root` over HTTP on localhost in a background thread, yielding the site's URL. A subclass of `QuietHandler`
+    can answer some requests differently, e.g. with errors.
+    """
+    handler = type("Handler", (handler,), {"latency": latency})
+    server = QuietServer(("127.0.0.1", port), functools.partial(handler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Workshop Manual, and optionally serve it")
+    parser.add_argument("root", type=Path, help="directory to generate the site into")
+    parser.add_argument("--wsm-id", default="SYNTH-01_Ver01")
+    parser.add_argument("--sections", type=int, default=3, help="top level ToC sections")
+    parser.add_argument("--depth", type=int, default=1, help="levels of nested ToCs below each section")
+    parser.add_argument("--fanout", type=int, default=3, help="child ToCs per nested ToC")
+    parser.add_argument("--pages", type=int, default=4, help="pages per innermost ToC")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve", action="store_true", help="serve the site once it has been generated")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of delay added to each response")
+    args = parser.parse_args()
+
+    manual = SyntheticManual(args.sections, args.depth, args.fanout, args.pages, args.seed)
+    manual.generate(args.root, args.wsm_id)
+    print(f"Generated {manual.page_count} pages in {args.root}")
+    if args.serve:
+        with serve(args.root, args.latency, args.port) as url:
+            print(f"Serving on {url}, scrape with site={url!r} and wsm_id={args.wsm_id!r}")
+            threading.Event().wait()
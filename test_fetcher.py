@@ -0,0 +1,123 @@
+import asyncio
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import httpx
+import pytest
+
+import synthetic
+from fetcher import Fetcher
+from metrics import Metrics
+
+
+@contextmanager
+def flaky_site(root, script: dict[str, list[tuple[int, dict[str, str]]]]):
+    """
+    Serve `root`, answering each path with the statuses and headers `script` lists for it, one per request, and with
+    the file once they run out. Yields the site's URL and the number of requests each path got.
+    """
+    requests = Counter()
+
+    class FlakyHandler(synthetic.QuietHandler):
+        def do_GET(self):
+            requests[self.path] += 1
+            responses = script.get(self.path, [])
+            if requests[self.path] > len(responses):
+                return super().do_GET()
+            status, headers = responses[requests[self.path] - 1]
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    with synthetic.serve(root, handler=FlakyHandler) as url:
+        yield url, requests
+
+
+def get(url: str, metrics: Metrics | None = None, **kwargs) -> tuple[httpx.Response | httpx.HTTPError, Fetcher]:
+    """What fetching `url` came to, a response or the error given up with, and the fetcher for a look at its limit."""
+    fetcher = Fetcher(**{"backoff": 0.01, **kwargs})
+
+    async def run():
+        async with fetcher:
+            try:
+                return await fetcher.get(url, metrics)
+            except httpx.HTTPError as e:
+                return e
+
+    return asyncio.run(run()), fetcher
+
+
+@pytest.fixture
+def root(tmp_path):
+    tmp_path.joinpath("page.html").write_text("<html></html>")
+    return tmp_path
+
+
+def test_retries_server_errors(root):
+    with flaky_site(root, {"/page.html": [(503, {}), (502, {})]}) as (url, requests):
+        response, _ = get(url + "/page.html", retries=3)
+    assert response.status_code == 200
+    assert response.text == "<html></html>"
+    assert requests["/page.html"] == 3
+
+
+def test_waits_as_long_as_retry_after_says(root):
+    start = time.monotonic()
+    with flaky_site(root, {"/page.html": [(429, {"Retry-After": "1"})]}) as (url, requests):
+        response, _ = get(url + "/page.html", retries=1)
+    assert response.status_code == 200
+    assert requests["/page.html"] == 2
+    assert time.monotonic() - start >= 1
+
+
+def test_retry_after_as_a_date():
+    date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+    response = httpx.Response(429, headers={"Retry-After": date})
+    assert 25 < Fetcher().retry_delay(0, response) <= 30
+
+
+def test_gives_up_after_the_last_retry(root):
+    with flaky_site(root, {"/page.html": [(500, {})] * 10}) as (url, requests):
+        error, _ = get(url + "/page.html", retries=2)
+    assert isinstance(error, httpx.HTTPStatusError)
+    assert error.response.status_code == 500
+    assert requests["/page.html"] == 3
+
+
+def test_client_errors_are_not_retried(root):
+    with flaky_site(root, {}) as (url, requests):
+        error, _ = get(url + "/missing.html", retries=3)
+    assert isinstance(error, httpx.HTTPStatusError)
+    assert error.response.status_code == 404
+    assert requests["/missing.html"] == 1
+
+
+def test_limit_halves_when_the_server_pushes_back(root):
+    with flaky_site(root, {"/page.html": [(503, {})]}) as (url, _):
+        error, fetcher = get(url + "/page.html", retries=0, concurrency=8)
+    assert isinstance(error, httpx.HTTPStatusError)
+    assert fetcher.limiter.limit == 4
+
+
+def test_limit_grows_while_the_server_keeps_up(root):
+    with flaky_site(root, {}) as (url, _):
+        response, fetcher = get(url + "/page.html", concurrency=4)
+    assert response.status_code == 200
+    # One more slot per window of successful requests
+    assert fetcher.limiter.limit == pytest.approx(4.25)
+
+
+def test_attempts_are_timed_apart_from_waiting(root):
+    metrics = Metrics()
+    with flaky_site(root, {"/page.html": [(503, {}), (429, {"Retry-After": "1"})]}) as (url, _):
+        response, _ = get(url + "/page.html", metrics, retries=2)
+    assert response.status_code == 200
+    assert metrics.histograms["fetch"].count == 3
+    assert metrics.histograms["fetch.wait"].count == 3
+    assert metrics.histograms["fetch.backoff"].count == 2
+    # The second wait was the Retry-After, which mustn't count as the server being slow to answer
+    assert metrics.histograms["fetch.backoff"].max >= 1
+    assert metrics.histograms["fetch"].max < 1
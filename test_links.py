@@ -0,0 +1,42 @@
+import random
+from pathlib import PurePath
+
+import pytest
+
+from main import LinkIndex
+
+
+def reference_relative(article_map: dict[str, str], page: str, href: str) -> str:
+    """The original link resolution, climbing from the page's directory until the target is below it."""
+    prefix = ''
+    path = PurePath(article_map[page]).parent
+    while not PurePath(article_map[href]).is_relative_to(path):
+        prefix += '../'
+        path = path.parent
+    return prefix + str(PurePath(article_map[href]).relative_to(path))
+
+
+def random_article_map(rng: random.Random, size: int) -> dict[str, str]:
+    # Few distinct names, so pages share long prefixes and files share names with directories
+    article_map = {}
+    for i in range(size):
+        directories = [rng.choice(['a', 'b', 'Body Work', 'id0001.md']) for _ in range(rng.randint(0, 4))]
+        name = rng.choice([f"id{i:04}.md", 'a', 'b'])
+        article_map[f"key{i}"] = '/'.join(directories + [name])
+    return article_map
+
+
+def test_link_to_a_file_named_like_a_directory_above():
+    article_map = {"page": "a/b/page.md", "a": "a"}
+    assert LinkIndex(article_map).relative(("a", "b"), "a") == reference_relative(article_map, "page", "a")
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_reference(seed):
+    rng = random.Random(seed)
+    article_map = random_article_map(rng, 300)
+    index = LinkIndex(article_map)
+    for _ in range(2000):
+        page, href = rng.choice(list(article_map)), rng.choice(list(article_map))
+        assert index.relative(index.directory(page), href) == reference_relative(article_map, page, href), \
+            (article_map[page], article_map[href])
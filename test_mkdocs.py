@@ -0,0 +1,75 @@
+import random
+import re
+
+import pytest
+import yaml
+
+from main import CAPITALIZED, YAML_DUMPER, mkdocs_events
+
+CONFIG = {
+    "markdown_extensions": ["sane_lists", "attr_list", "def_list"],
+    "plugins": [{"search": {"indexing": "titles"}}],
+    "site_name": "Mazda WSM // MAZDA SYNTH (SYNTH-01_Ver01)",
+    "theme": {"name": "terminal", "features": ["navigation.side.indexes"]},
+}
+# Titles YAML would read back as something other than a string, or can only write quoted
+SPECIAL = ["yes", "no", "on", "null", "~", "true", "1", "0x1F", "1.5", "1e3", "2024-01-01", "12:30", "- a", "? b",
+           ": c", "d: e", "f #g", "#h", "[i]", "{j}", "&k", "*l", "!m", "%n", "@o", "`p", "'q'", '"r"', "s|t", ">u",
+           " v", "w ", "", "Café", "Ölwanne", "x\ty", "z,"]
+
+
+def listify_dict(d: dict) -> list:
+    """The original nav conversion, ahead of a plain `yaml.dump` of the whole config."""
+    result = []
+
+    for key, value in d.items():
+        key = key.title()
+
+        for cap in CAPITALIZED:
+            key = re.sub(rf"{cap.capitalize()}(\W)", rf"{cap}\g<1>", key)
+
+        if isinstance(value, dict):
+            result.append({
+                key: listify_dict(value)
+            })
+        else:
+            result.append({
+                key: value
+            })
+
+    return result
+
+
+def random_title(rng: random.Random) -> str:
+    words = []
+    for _ in range(rng.randint(1, 4)):
+        match rng.random():
+            case r if r < 0.4:
+                words.append(rng.choice(sorted(CAPITALIZED)).lower())
+            case r if r < 0.6:
+                words.append(rng.choice(SPECIAL))
+            case _:
+                words.append(rng.choice(["engine", "brake", "sensor", "removal", "(front)", "and", "A/T"]))
+    return rng.choice([" ", "/", "-", ", "]).join(words)
+
+
+def random_nav(rng: random.Random, depth: int) -> dict:
+    nav = {}
+    for _ in range(rng.randint(1, 5)):
+        if depth and rng.random() < 0.4:
+            nav[random_title(rng)] = random_nav(rng, depth - 1)
+        else:
+            nav[random_title(rng)] = rng.choice(SPECIAL + ["engine/id0001.md", "brake/id0002.md"])
+    return nav
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        nav = random_nav(rng, 3)
+        expected = yaml.dump({**CONFIG, "nav": listify_dict(nav)})
+        # Byte for byte with the emitter `yaml.dump` uses, and to the same data with whichever one is fastest
+        assert yaml.emit(mkdocs_events(CONFIG, nav), Dumper=yaml.Dumper) == expected, nav
+        assert yaml.safe_load(yaml.emit(mkdocs_events(CONFIG, nav), Dumper=YAML_DUMPER)) == \
+            yaml.safe_load(expected), nav
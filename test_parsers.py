@@ -0,0 +1,49 @@
+import asyncio
+import shutil
+
+import pytest
+
+import main
+import synthetic
+
+pytest.importorskip("lxml")
+
+WSM_ID = "SYNTH-01_Ver01"
+
+
+def build(cache, **kwargs) -> main.WSMScraper:
+    scraper = main.WSMScraper(cache, WSM_ID, convert_workers=2, **kwargs)
+    asyncio.run(scraper.scrape())
+    return scraper
+
+
+def docs(cache) -> dict[str, bytes]:
+    root = cache.joinpath(WSM_ID, "docs")
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in sorted(root.rglob("*.md"))}
+
+
+@pytest.fixture(scope="module")
+def scraped(tmp_path_factory):
+    """A synthetic manual scraped with `html.parser`, one of its pages in Latin-1 without any declared charset."""
+    workdir = tmp_path_factory.mktemp("parsers")
+    manual = synthetic.SyntheticManual(sections=2, depth=1, fanout=2, pages=2, seed=3).generate(
+        workdir.joinpath("site"), WSM_ID)
+    page = manual.joinpath("esicont", "srvc", "html", "id000000000001.html")
+    page.write_bytes(page.read_bytes().replace(b"<h1>", "<h1>Café ".encode("latin-1"), 1))
+    with synthetic.serve(workdir.joinpath("site")) as site:
+        build(workdir.joinpath("html.parser"), site=site, parser="html.parser")
+    return workdir
+
+
+def test_both_parsers_give_the_same_markdown(scraped):
+    shutil.copytree(scraped.joinpath("html.parser"), scraped.joinpath("lxml"))
+    scraper = build(scraped.joinpath("lxml"), offline=True, parser="lxml")
+    # Switching parsers makes every page out of date
+    assert scraper.metrics.counters["convert.pages"] == len(scraper.pages)
+    assert not scraper.metrics.counters["convert.fresh"]
+
+    expected, actual = docs(scraped.joinpath("html.parser")), docs(scraped.joinpath("lxml"))
+    assert expected.keys() == actual.keys()
+    for key in expected:
+        assert actual[key] == expected[key], key
+    assert any("Café".encode("utf-8") in markdown for markdown in actual.values())
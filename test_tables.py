@@ -0,0 +1,136 @@
+import random
+from io import StringIO
+
+import pytest
+
+from mdconverter import Cell, TableConverter
+
+
+class ReferenceConverter(TableConverter):
+    """The original cell-by-cell table rendering, which the faster one has to match byte for byte."""
+
+    def convert_table(self, el, text, parent_tags):
+        if 'table' in parent_tags or not self._current_table.col_count:
+            text = text.strip().strip('|')
+
+            if '|' not in text:
+                self._reset_table()
+                return text
+
+            raise NotImplementedError("Nested tables are not supported")
+
+        column_sizes = []
+        for col in range(self._current_table.col_count):
+            max_col_size = 0
+            for row in range(self._current_table.row_count):
+                if self._current_table.cell(row, col).size > max_col_size:
+                    max_col_size = self._current_table.cell(row, col).size
+            column_sizes.append(max_col_size)
+
+        result = StringIO()
+        for row in range(self._current_table.row_count):
+            data_line = ''
+            top_border = ''
+            bottom_border = ''
+
+            for col in range(self._current_table.col_count):
+                cell = self._current_table.cell(row, col)
+
+                if self._current_table.cell(row, col).rowspan > 1:
+                    border_line_char = ' '
+
+                    if len(bottom_border) > 0 and bottom_border[-1] == '-':
+                        border_limit_left = '+'
+                    else:
+                        border_limit_left = '|'
+                else:
+                    border_line_char = '-'
+                    border_limit_left = '+'
+
+                if not cell.spans_left:
+                    data_line     += '|' + cell.text.ljust(column_sizes[col])
+                    top_border    += '+' + '-' * column_sizes[col]
+
+                    bottom_border += border_limit_left + border_line_char * column_sizes[col]
+                else:
+                    data_line   += ' ' * (column_sizes[col] + 1)
+                    top_border  += '-' * (column_sizes[col] + 1)
+
+                    if row < self._current_table.row_count - 1 and not self._current_table.cell(row + 1, col).spans_left:
+                        bottom_border += border_limit_left + border_line_char * column_sizes[col]
+                    else:
+                        bottom_border += border_line_char * (column_sizes[col] + 1)
+
+            data_line     += '|'
+            top_border    += '+'
+
+            if bottom_border[-1] == '-':
+                bottom_border += '+'
+            else:
+                bottom_border += '|'
+
+            if row == 0:
+                print(top_border, file=result)
+                if self._current_table.row_count > 1:
+                    bottom_border = bottom_border.replace('-', '=')
+            print(data_line, file=result)
+            print(bottom_border, file=result)
+
+        self._reset_table()
+
+        return '\n\n' + result.getvalue()
+
+    def _convert_cell(self, el, text):
+        colspan = rowspan = 1
+        if 'colspan' in el.attrs and el['colspan'].isdigit():
+            colspan = int(el['colspan'])
+        if 'rowspan' in el.attrs and el['rowspan'].isdigit():
+            rowspan = int(el['rowspan'])
+        text = ' ' + text.strip().replace('\n', ' ') + ' '
+
+        while self._current_table.cell(self._current_row, self._current_col).spans_up:
+            self._current_col += 1
+
+        self._current_table.set(self._current_row, self._current_col, Cell(colspan, rowspan, len(text), text))
+
+        for col in range(colspan):
+            for row in range(rowspan):
+                if col > 0:
+                    self._current_table.cell(self._current_row + row, self._current_col + col).spans_left = True
+                if row > 0:
+                    self._current_table.cell(self._current_row + row, self._current_col + col).spans_up = True
+                self._current_table.cell(self._current_row + row, self._current_col + col).colspan = colspan - col
+                self._current_table.cell(self._current_row + row, self._current_col + col).rowspan = rowspan - row
+
+        self._current_col += colspan
+        return text
+
+
+def random_table(rng: random.Random) -> str:
+    rows = []
+    for _ in range(rng.randint(1, 6)):
+        cells = []
+        for _ in range(rng.randint(1, 5)):
+            attrs = ''
+            if rng.random() < 0.3:
+                attrs += f' colspan="{rng.randint(0, 4)}"'
+            if rng.random() < 0.3:
+                attrs += f' rowspan="{rng.randint(0, 5)}"'
+            text = ' '.join(rng.choice(['a', 'bb', 'ccc', 'dddd', '']) for _ in range(rng.randint(0, 3)))
+            tag = rng.choice(['td', 'th'])
+            cells.append(f'<{tag}{attrs}>{text}</{tag}>')
+        rows.append('<tr>' + ''.join(cells) + '</tr>')
+    return '<table>' + ''.join(rows) + '</table>'
+
+
+def test_zero_span_deeper_than_grid():
+    html = '<table><tr><td>x</td><td rowspan="3" colspan="0">y</td></tr><tr><td>z</td></tr></table>'
+    assert TableConverter().convert(html) == ReferenceConverter().convert(html)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        html = random_table(rng)
+        assert TableConverter().convert(html) == ReferenceConverter().convert(html), html
@@ -0,0 +1,158 @@
+"""
+Watch mode for working on the conversion rules. A manual that has been scraped before is loaded from its cache once,
+and from then on every change to the rules (`mdconverter.py`, `main.py`, ...) or to one of its cached pages converts
+again just the pages it affects, with the link map, nav and images kept in memory. A change to the image encoder
+(`images.py`) encodes the images those pages show again as well.
+
+    python watch.py --wsm-id D933-1A-22C_Ver26 --pages 'id0102*' --serve
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import sys
+import time
+import traceback
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+
+import images
+import main
+import mdconverter
+import search
+
+# Reloaded in this order, each one after the modules it imports from
+RULES = [mdconverter, search, images, main]
+
+
+def snapshot(paths) -> dict[Path, int]:
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            pass
+    return mtimes
+
+
+class Watcher:
+    def __init__(self, scraper: main.WSMScraper, patterns: list[str], interval: float = 0.25):
+        self.scraper = scraper
+        self.interval = interval
+        # The pages converted again when the rules change, and those of them cached as files that can be edited
+        self.pages = [page for page in scraper.pages
+                      if any(fnmatch(PurePosixPath(page[1]).name, pattern) for pattern in patterns)]
+        self.sources = {path: page for page in self.pages if (path := scraper.cache.path(page[1]))}
+        self.rules = [Path(module.__file__) for module in RULES]
+
+    def reload(self) -> bool:
+        try:
+            for module in RULES:
+                importlib.reload(module)
+        except Exception:
+            logging.error(f"Couldn't load the changed rules, keeping the previous ones:\n{traceback.format_exc()}")
+            return False
+        # Makes every page out of date, but only those whose Markdown comes out different are written
+        self.scraper.converter_version = main.converter_version()
+        return True
+
+    async def image_groups(self) -> dict[str, list[str]]:
+        """The images shown by the watched pages, grouped as `WSMScraper.image_groups` does, if the encoder changed."""
+        scraper = self.scraper
+        version = images.encoder_version(scraper.image_format)
+        if version == scraper.encoder_version:
+            return {}
+        scraper.encoder_version = version
+        # Along with every other name sharing a file with one of them, so each file is encoded under the same name
+        shown = {name for page in self.pages for name in scraper.page_images(page[1])}
+        files = {scraper.images[name].file for name in shown if name in scraper.images}
+        stale = {name for name, image in scraper.images.items() if image.file in files}
+        for name in stale:
+            del scraper.images[name]
+        return {source: names for source, names in (await scraper.image_groups()).items() if stale.issuperset(names)}
+
+    async def convert(self, pages: list, groups: dict[str, list[str]] | None = None):
+        counters = self.scraper.metrics.counters
+        encoded, converted, written = counters["image.encoded"], counters["convert.pages"], counters["write.files"]
+        start = time.perf_counter()
+        try:
+            await self.scraper.convert(pages, groups)
+            self.scraper.write_search_index()
+        except Exception:
+            logging.error(f"Conversion failed:\n{traceback.format_exc()}")
+            return
+        logging.info(f"Encoded {counters['image.encoded'] - encoded} images and converted "
+                     f"{counters['convert.pages'] - converted} pages in "
+                     f"{1000 * (time.perf_counter() - start):.0f}ms, {counters['write.files'] - written} changed")
+
+    async def run(self):
+        logging.info(f"Watching {len(self.rules)} rule modules and {len(self.sources)} cached pages")
+        rules, sources = snapshot(self.rules), snapshot(self.sources)
+        while True:
+            await asyncio.sleep(self.interval)
+            new_rules, new_sources = snapshot(self.rules), snapshot(self.sources)
+            pages = [self.sources[path] for path, mtime in new_sources.items() if sources.get(path) != mtime]
+            groups = {}
+            if new_rules != rules and self.reload():
+                pages, groups = self.pages, await self.image_groups()
+            rules, sources = new_rules, new_sources
+            if pages:
+                await self.convert(pages, groups)
+
+
+async def serve(config: Path, address: str):
+    """`mkdocs serve` the site, which reloads it in the browser whenever a converted page changes."""
+    process = await asyncio.create_subprocess_exec(sys.executable, "-m", "mkdocs", "serve", "--config-file",
+                                                   str(config), "--dev-addr", address)
+    try:
+        if code := await process.wait():
+            logging.error(f"mkdocs serve exited with {code}, still watching")
+    finally:
+        if process.returncode is None:
+            process.terminate()
+            await process.wait()
+
+
+async def watch(args):
+    scraper = main.WSMScraper(args.cache, args.wsm_id, convert_workers=args.workers, offline=True,
+                              parser=args.parser, cache=args.store, image_format=args.images)
+    try:
+        # Brings the site up to date first, which also loads everything a conversion needs
+        await scraper.crawl()
+        await scraper.build()
+        scraper.metrics.save(scraper.output_path.joinpath("profile.json"))
+
+        server = asyncio.create_task(serve(scraper.output_path.joinpath("mkdocs.yml"), args.serve)) \
+            if args.serve else None
+        try:
+            await Watcher(scraper, args.pages, args.interval).run()
+        finally:
+            if server:
+                server.cancel()
+    finally:
+        scraper.cache.close()
+        await scraper.fetcher.aclose()
+        scraper.checkpoint.remove()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a cached manual again whenever its conversion rules or "
+                                                 "cached pages change")
+    parser.add_argument("--cache", default="wsm", help="directory holding the download cache and generated sites")
+    parser.add_argument("--wsm-id", default="D933-1A-22C_Ver26", help="an already scraped manual")
+    parser.add_argument("--pages", nargs="+", default=["*"], metavar="PATTERN",
+                        help="only convert pages whose cached filename matches one of these, e.g. 'id0102*' "
+                             "(default: every page)")
+    parser.add_argument("--serve", nargs="?", const="127.0.0.1:8000", metavar="ADDRESS",
+                        help="run `mkdocs serve` on the site as well (default address: %(const)s)")
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between checks for changes")
+    parser.add_argument("--store", default="loose", choices=["loose", "packed"], help="cache layout of the manual")
+    parser.add_argument("--parser", default=main.HTML_PARSER, choices=["html.parser", "lxml"])
+    parser.add_argument("--images", default="png", choices=main.IMAGE_FORMATS)
+    parser.add_argument("--workers", type=int, default=main.CONVERT_WORKERS, help="conversion processes")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(watch(args))
+    except KeyboardInterrupt:
+        pass